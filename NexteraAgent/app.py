@@ -1,11 +1,23 @@
-import os, json, sqlite3, asyncio, re
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+import os, sys, json, sqlite3, asyncio, re, time, queue, threading, random
+import concurrent.futures
+import bisect
+import contextvars
+import functools
+import hashlib
+import hmac
+import math
+import socket
+import uuid
+import zlib
+from collections import OrderedDict, deque
+import importlib.util
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, List, Optional, Tuple
 import httpx
 from fastapi import FastAPI, Request, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from apscheduler.schedulers.background import BackgroundScheduler
 import logging
 from dotenv import load_dotenv
 
@@ -26,19 +38,539 @@ OWNER_EMAIL = os.getenv("OWNER_EMAIL", "admin@nexteraestate.com")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 LEARNING_MODE = os.getenv("LEARNING_MODE", "true").lower() == "true"
 AUTO_FIX_MODE = os.getenv("AUTO_FIX_MODE", "true").lower() == "true"
+PROBE_CONNECT_TIMEOUT = float(os.getenv("PROBE_CONNECT_TIMEOUT", "5"))
+PROBE_READ_TIMEOUT = float(os.getenv("PROBE_READ_TIMEOUT", "15"))
+PROBE_MAX_CONNECTIONS = int(os.getenv("PROBE_MAX_CONNECTIONS", "50"))
+PROBE_HTTP2 = os.getenv("PROBE_HTTP2", "false").lower() == "true"
+PROBES_FILE = os.getenv("PROBES_FILE", "probes.json")
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", "20"))
+PROBE_DEFAULT_INTERVAL = float(os.getenv("PROBE_DEFAULT_INTERVAL", "300"))
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "45"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "true").lower() == "true"
+INCIDENT_ESCALATE_AFTER = int(os.getenv("INCIDENT_ESCALATE_AFTER", "12"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "10"))
+METRICS_RAW_RETENTION_DAYS = float(os.getenv("METRICS_RAW_RETENTION_DAYS", "1"))
+MONITOR_INTERVAL = float(os.getenv("MONITOR_INTERVAL", "300"))
+MONITOR_INITIAL_DELAY = float(os.getenv("MONITOR_INITIAL_DELAY", "60"))
+MONITOR_JITTER = float(os.getenv("MONITOR_JITTER", "15"))
+MONITOR_MISSED_RUNS = os.getenv("MONITOR_MISSED_RUNS", "skip")  # skip | run_once
+MONITOR_SHUTDOWN_GRACE = float(os.getenv("MONITOR_SHUTDOWN_GRACE", "10"))
+HEALTH_SNAPSHOT_MAX_AGE = float(os.getenv("HEALTH_SNAPSHOT_MAX_AGE", "60"))
+MONITOR_DEGRADED_INTERVAL = float(os.getenv("MONITOR_DEGRADED_INTERVAL", "60"))
+PROBE_MIN_INTERVAL = float(os.getenv("PROBE_MIN_INTERVAL", "15"))
+PROBE_DEGRADED_FACTOR = float(os.getenv("PROBE_DEGRADED_FACTOR", "0.2"))
+PROBE_BACKOFF_FACTOR = float(os.getenv("PROBE_BACKOFF_FACTOR", "2"))
+PROBE_STABLE_AFTER = int(os.getenv("PROBE_STABLE_AFTER", "5"))
+PROBE_JITTER = float(os.getenv("PROBE_JITTER", "0.1"))
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", "600"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "15"))
+LEADER_HEARTBEAT = float(os.getenv("LEADER_HEARTBEAT", "5"))
+FOLLOWER_SYNC_INTERVAL = float(os.getenv("FOLLOWER_SYNC_INTERVAL", "60"))
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_MAX_SUBSCRIBERS = int(os.getenv("EVENT_MAX_SUBSCRIBERS", "100"))
+EVENT_TICKET_TTL = int(os.getenv("EVENT_TICKET_TTL", "60"))
+EVENT_KEEPALIVE = float(os.getenv("EVENT_KEEPALIVE", "15"))
+EVENT_RELAY_INTERVAL = float(os.getenv("EVENT_RELAY_INTERVAL", "1"))
+EVENT_RETENTION = int(os.getenv("EVENT_RETENTION", "3600"))
+AUTH_FAILURE_BURST = float(os.getenv("AUTH_FAILURE_BURST", "10"))
+AUTH_FAILURE_RATE = float(os.getenv("AUTH_FAILURE_RATE", "10"))  # failed attempts refilled per minute
+AUTH_SUMMARY_WINDOW = float(os.getenv("AUTH_SUMMARY_WINDOW", "60"))
+AUTH_TRACKED_IPS = int(os.getenv("AUTH_TRACKED_IPS", "10000"))
+COLUMN_CODEC = os.getenv("COLUMN_CODEC", "zlib-dict")  # none | zlib | zlib-dict (newest dictionary) | zlib-dict-v1 | zstd
+COLUMN_CODEC_MIN_SIZE = int(os.getenv("COLUMN_CODEC_MIN_SIZE", "96"))
+INCIDENT_DATA_MAX = int(os.getenv("INCIDENT_DATA_MAX", "65536"))
+LESSON_SIMILARITY = float(os.getenv("LESSON_SIMILARITY", "0.6"))
+LESSON_REINFORCEMENT = float(os.getenv("LESSON_REINFORCEMENT", "0.1"))
+LESSON_DEDUP_CANDIDATES = int(os.getenv("LESSON_DEDUP_CANDIDATES", "10"))
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1200"))
+SEARCH_SNIPPET_TOKENS = int(os.getenv("SEARCH_SNIPPET_TOKENS", "48"))
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "40"))
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_BUFFER_SPANS = int(os.getenv("TRACE_BUFFER_SPANS", "5000"))
+TRACE_EXPORT_DIR = os.getenv("TRACE_EXPORT_DIR", "traces")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "64"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "25"))
 
 print(f"🤖 NexteraEstate Autonomous Tech Director Starting...")
 print(f"📍 Monitoring: {SITE_URL} | {API_URL}")
 print(f"🧠 Learning Mode: {LEARNING_MODE} | Auto-Fix: {AUTO_FIX_MODE}")
 print(f"👤 Owner: {OWNER_EMAIL}")
 
+# In-process metrics (Prometheus text exposition)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names: tuple, values: tuple, extra: Optional[str] = None) -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[tuple, Any] = {}
+        self.function = None
+
+    def key(self, labels: Dict[str, Any]) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def set_function(self, function):
+        """Compute the (unlabelled) value at scrape time instead of on every event"""
+        self.function = function
+
+    def samples(self) -> Dict[tuple, Any]:
+        if self.function is not None:
+            return {(): self.function()}
+        return self.values
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in list(self.samples().items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self.key(labels)] = value
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; observe() is a bisect plus three increments"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q: float, key: tuple = ()) -> Optional[float]:
+        """Estimate a quantile by linear interpolation inside the bucket that contains it"""
+        series = self.values.get(key)
+        if not series or not series[2]:
+            return None
+        rank = q * series[2]
+        seen = 0
+        for i, count in enumerate(series[0]):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return round(lower + (upper - lower) * (rank - seen) / count, 6)
+            seen += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """Counters and gauges as-is; histograms as count and estimated p50/p95/p99 (seconds)"""
+        result = {}
+        for name, metric in self.metrics.items():
+            series = {}
+            for key, value in list(metric.samples().items()):
+                label = ",".join(f"{n}={v}" for n, v in zip(metric.labelnames, key)) or "all"
+                if isinstance(metric, Histogram):
+                    series[label] = {
+                        "count": value[2],
+                        **{f"p{int(q * 100)}": metric.quantile(q, key) for q in (0.5, 0.95, 0.99)}
+                    }
+                else:
+                    series[label] = value
+            result[name] = series
+        return result
+
+metrics = MetricsRegistry()
+HTTP_REQUESTS = metrics.counter("agent_http_requests_total", "HTTP requests served", ("method", "route", "status"))
+HTTP_DURATION = metrics.histogram("agent_http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HEALTH_CHECKS = metrics.counter("agent_health_checks_total", "Comprehensive health checks by overall status", ("status",))
+HEALTH_CHECK_DURATION = metrics.histogram("agent_health_check_duration_seconds", "Comprehensive health check latency")
+PROBES = metrics.counter("agent_probes_total", "Probe executions by target and outcome", ("target", "outcome"))
+PROBE_DURATION = metrics.histogram("agent_probe_duration_seconds", "Probe round-trip latency", ("target",))
+INCIDENTS = metrics.counter("agent_incidents_total", "Incident occurrences by source and transition", ("source", "transition"))
+LLM_REQUESTS = metrics.counter("agent_llm_requests_total", "Gemini calls by mode and outcome", ("mode", "outcome"))
+LLM_DURATION = metrics.histogram("agent_llm_request_duration_seconds", "Gemini call latency", ("mode",))
+LLM_CACHE_LOOKUPS = metrics.counter("agent_llm_cache_lookups_total", "Prompt cache lookups", ("result",))
+DB_COMMITS = metrics.counter("agent_db_commits_total", "SQLite group commits")
+DB_ROWS = metrics.counter("agent_db_rows_written_total", "Rows written through the storage writer")
+DB_COMMIT_DURATION = metrics.histogram("agent_db_commit_duration_seconds", "Time to execute and commit one write batch")
+DB_QUEUE_DEPTH = metrics.gauge("agent_db_write_queue_depth", "Writes waiting for the storage writer")
+EVENTS_PUBLISHED = metrics.counter("agent_events_published_total", "Events pushed to stream subscribers", ("event", "origin"))
+EVENTS_DROPPED = metrics.counter("agent_events_dropped_total", "Events discarded for subscribers that fell behind")
+AUTH_FAILURES = metrics.counter("agent_auth_failures_total", "Rejected or flagged admin requests", ("reason",))
+BREAKER_STATE = metrics.gauge("agent_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("breaker",))
+BREAKER_REJECTIONS = metrics.counter("agent_circuit_rejections_total", "Calls failed fast by an open circuit", ("breaker",))
+EVENT_SUBSCRIBERS = metrics.gauge("agent_event_subscribers", "Open /agent/events streams")
+
+# Span tracing: nested spans land in a bounded ring buffer and export as Chrome trace
+# events (chrome://tracing, Perfetto) or OTLP/JSON. The current span rides a contextvar,
+# so tasks spawned inside a span (gather, create_task) become its children.
+current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "lane", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.lane = span_lane()
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return round((self.end_ns - self.start_ns) / 1e6, 3)
+
+def span_lane() -> str:
+    """Timeline row for a span: the asyncio task on the loop, otherwise the thread"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return task.get_name() if task else threading.current_thread().name
+
+class Tracer:
+    """Records finished spans in a ring buffer of the last `capacity` spans"""
+
+    def __init__(self, capacity: int = TRACE_BUFFER_SPANS, enabled: bool = TRACE_ENABLED):
+        self.enabled = enabled
+        self.spans: deque = deque(maxlen=capacity)
+        self.dropped = 0
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            yield None
+            return
+        span = self.start(name, **attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__ if isinstance(e, asyncio.CancelledError) else (str(e) or type(e).__name__)
+            raise
+        finally:
+            current_span.reset(token)
+            self.finish(span)
+
+    def traced(self, name: str):
+        """Decorator: run an async function inside a span"""
+        def decorate(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return await function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def annotate(self, **attributes):
+        """Attach attributes to the current span, if any"""
+        span = current_span.get()
+        if span is not None:
+            span.set(**attributes)
+
+    def start(self, name: str, **attributes) -> Optional[Span]:
+        """Open a span without making it current (for async generators and callbacks)"""
+        return Span(name, current_span.get(), attributes) if self.enabled else None
+
+    def record(self, name: str, parent: Optional[Span], seconds: float, **attributes):
+        """Record a span that just ended after `seconds`, e.g. from a thread outside the context"""
+        if not self.enabled:
+            return
+        span = Span(name, parent, attributes)
+        span.start_ns = time.time_ns() - int(seconds * 1e9)
+        self.finish(span)
+
+    def finish(self, span: Optional[Span], error: Optional[str] = None):
+        if span is None:
+            return
+        span.end_ns = time.time_ns()
+        span.error = error or span.error
+        if len(self.spans) == self.spans.maxlen:
+            self.dropped += 1
+        self.spans.append(span)
+
+    def select(self, trace_id: Optional[str] = None, limit: Optional[int] = None) -> List[Span]:
+        """Finished spans, optionally for one trace or for the `limit` most recent traces"""
+        spans = list(self.spans)
+        if trace_id:
+            return [s for s in spans if s.trace_id == trace_id]
+        if limit:
+            recent = list(dict.fromkeys(s.trace_id for s in reversed(spans)))[:limit]
+            spans = [s for s in spans if s.trace_id in set(recent)]
+        return spans
+
+    def traces(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent traces, newest first, summarised by their root span"""
+        grouped: Dict[str, List[Span]] = {}
+        # Snapshot first: the storage writer thread appends commit spans concurrently
+        for span in list(self.spans):
+            grouped.setdefault(span.trace_id, []).append(span)
+        summaries = []
+        for trace_id, spans in grouped.items():
+            root = next((s for s in spans if s.parent_id is None), None) or min(spans, key=lambda s: s.start_ns)
+            summaries.append({
+                "trace_id": trace_id,
+                "name": root.name,
+                "started": datetime.utcfromtimestamp(root.start_ns / 1e9).isoformat(),
+                "duration_ms": root.duration_ms,
+                "spans": len(spans),
+                "errors": sum(1 for s in spans if s.error),
+                "complete": root.parent_id is None,
+            })
+        summaries.sort(key=lambda t: t["started"], reverse=True)
+        return summaries[:limit]
+
+    def chrome(self, spans: List[Span]) -> Dict[str, Any]:
+        """Chrome trace-event JSON; one timeline row per task or thread"""
+        lanes: Dict[str, int] = {}
+        events = []
+        for span in spans:
+            tid = lanes.setdefault(span.lane, len(lanes) + 1)
+            args = {**span.attributes, "trace_id": span.trace_id, "span_id": span.span_id}
+            if span.error:
+                args["error"] = span.error
+            events.append({
+                "name": span.name, "cat": span.name.split(".", 1)[0], "ph": "X", "pid": os.getpid(), "tid": tid,
+                "ts": span.start_ns / 1000, "dur": (span.end_ns - span.start_ns) / 1000, "args": args,
+            })
+        events += [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": lane}}
+            for lane, tid in lanes.items()
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def otlp(self, spans: List[Span]) -> Dict[str, Any]:
+        """OTLP/JSON (ExportTraceServiceRequest) that an OpenTelemetry collector can ingest"""
+        def value(v: Any) -> Dict[str, Any]:
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+        
+        def otlp_span(span: Span) -> Dict[str, Any]:
+            encoded = {
+                "traceId": span.trace_id, "spanId": span.span_id, "name": span.name, "kind": 1,
+                "startTimeUnixNano": str(span.start_ns), "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": k, "value": value(v)} for k, v in span.attributes.items() if v is not None],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                encoded["parentSpanId"] = span.parent_id
+            return encoded
+        
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": "nextera-agent"}},
+                {"key": "service.instance.id", "value": {"stringValue": f"{socket.gethostname()}:{os.getpid()}"}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "nextera-agent", "version": "2.0.0"}, "spans": [otlp_span(s) for s in spans]}],
+        }]}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "buffered_spans": len(self.spans), "capacity": self.spans.maxlen, "dropped": self.dropped}
+
+tracer = Tracer()
+
+# Leaf frames that mean a thread is parked rather than burning CPU
+PROFILE_IDLE_FRAMES = {
+    ("selectors.py", "select"), ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"), ("thread.py", "_worker"),
+}
+
+class SamplingProfiler:
+    """Statistical profiler: samples every thread's Python stack via sys._current_frames().
+
+    Costs one stack walk per thread per interval and needs no restart or instrumentation,
+    so it is safe to run against the live process for short windows.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.captures = 0
+
+    @property
+    def running(self) -> bool:
+        return self.lock.locked()
+
+    def sample(self, seconds: float, interval: float) -> Dict[str, Any]:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks: Dict[Tuple[str, ...], int] = {}
+        busy: Dict[str, int] = {}
+        idle: Dict[str, int] = {}
+        samples = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                thread = names.get(ident) or f"thread-{ident}"
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                stack = []
+                depth = 0
+                while frame is not None and depth < PROFILE_MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                    depth += 1
+                del frame
+                key = (thread, *reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+                counts = idle if leaf in PROFILE_IDLE_FRAMES else busy
+                counts[thread] = counts.get(thread, 0) + 1
+            samples += 1
+            time.sleep(interval)
+        
+        # Self time: the leaf frame of busy samples; total time: every distinct frame on the stack
+        self_time: Dict[str, int] = {}
+        total_time: Dict[str, int] = {}
+        for key, count in stacks.items():
+            frames = key[1:]
+            if not frames or self.is_idle(frames[-1]):
+                continue
+            self_time[frames[-1]] = self_time.get(frames[-1], 0) + count
+            for name in set(frames):
+                total_time[name] = total_time.get(name, 0) + count
+        busy_samples = sum(busy.values()) or 1
+        
+        def top(table: Dict[str, int]) -> List[Dict[str, Any]]:
+            ranked = sorted(table.items(), key=lambda item: item[1], reverse=True)[:PROFILE_TOP]
+            return [{"frame": frame, "samples": n, "percent": round(100 * n / busy_samples, 1)} for frame, n in ranked]
+        
+        return {
+            "seconds": round(time.perf_counter() - started, 2),
+            "interval_ms": round(interval * 1000, 2),
+            "samples": samples,
+            "threads": {
+                thread: {"busy": busy.get(thread, 0), "idle": idle.get(thread, 0)}
+                for thread in sorted(set(busy) | set(idle))
+            },
+            "top_self": top(self_time),
+            "top_total": top(total_time),
+            "folded": [f"{';'.join(key)} {count}" for key, count in sorted(stacks.items(), key=lambda item: -item[1])],
+        }
+
+    @staticmethod
+    def is_idle(frame: str) -> bool:
+        name, location = frame.split(" (", 1)
+        return (location.split(":", 1)[0], name) in PROFILE_IDLE_FRAMES
+
+    async def capture(self, seconds: float, interval: float) -> Optional[Dict[str, Any]]:
+        """Sample for `seconds` on a worker thread; None if a capture is already running"""
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            self.captures += 1
+            return await asyncio.get_running_loop().run_in_executor(None, self.sample, seconds, interval)
+        finally:
+            self.lock.release()
+
+profiler = SamplingProfiler()
+
 # Database setup
 DB_PATH = "nextera_agent.db"
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cur = conn.cursor()
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "256"))
+
+def now_ts() -> int:
+    """Timestamps are stored as integer epoch seconds so they sort and range-scan on an index"""
+    return int(time.time())
 
-# Enhanced database schema
-cur.execute("""CREATE TABLE IF NOT EXISTS incidents (
+def ts_to_iso(ts: Any) -> Optional[str]:
+    """Render a stored timestamp the way the API has always returned it"""
+    if ts is None or isinstance(ts, str):
+        return ts
+    return datetime.utcfromtimestamp(ts).isoformat()
+
+def to_epoch(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value)
+        # Naive timestamps are UTC, like everything the agent stores
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+# Schema as first shipped; later versions evolve it through MIGRATIONS
+BASELINE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS incidents (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     ts TEXT,
     source TEXT,
@@ -48,18 +580,16 @@ cur.execute("""CREATE TABLE IF NOT EXISTS incidents (
     data TEXT,
     resolved BOOLEAN DEFAULT FALSE,
     resolution TEXT
-)""")
-
-cur.execute("""CREATE TABLE IF NOT EXISTS lessons (
+)""",
+    """CREATE TABLE IF NOT EXISTS lessons (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     ts TEXT,
     category TEXT,
     lesson TEXT,
     confidence REAL DEFAULT 0.5,
     applied_count INTEGER DEFAULT 0
-)""")
-
-cur.execute("""CREATE TABLE IF NOT EXISTS fixes (
+)""",
+    """CREATE TABLE IF NOT EXISTS fixes (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     ts TEXT,
     incident_id INTEGER,
@@ -67,135 +597,1480 @@ cur.execute("""CREATE TABLE IF NOT EXISTS fixes (
     fix_action TEXT,
     success BOOLEAN,
     result TEXT
-)""")
-
-cur.execute("""CREATE TABLE IF NOT EXISTS performance_metrics (
+)""",
+    """CREATE TABLE IF NOT EXISTS performance_metrics (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     ts TEXT,
     metric_name TEXT,
     metric_value REAL,
     context TEXT
-)""")
-
-cur.execute("""CREATE TABLE IF NOT EXISTS knowledge_base (
+)""",
+    """CREATE TABLE IF NOT EXISTS knowledge_base (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     ts TEXT,
     topic TEXT,
     content TEXT,
     source TEXT,
     reliability REAL DEFAULT 0.5
-)""")
+)""",
+]
+
+def add_columns(table: str, columns: Dict[str, str]):
+    """Migration step that adds columns only where they are missing"""
+    def step(db: sqlite3.Connection):
+        existing = {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+        for name, declaration in columns.items():
+            if name not in existing:
+                db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+    return step
+
+def rebuild_table(table: str, create_sql: str, columns: List[str], conversions: Dict[str, str]):
+    """Migration step that recreates a table with new column types, converting values on copy"""
+    def step(db: sqlite3.Connection):
+        db.execute(create_sql.replace(f"CREATE TABLE {table} ", f"CREATE TABLE {table}_new ", 1))
+        select = ", ".join(conversions.get(column, column) for column in columns)
+        db.execute(f"INSERT INTO {table}_new ({', '.join(columns)}) SELECT {select} FROM {table}")
+        db.execute(f"DROP TABLE {table}")
+        db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    return step
+
+def epoch_sql(column: str) -> str:
+    return f"CASE WHEN typeof({column}) = 'text' THEN CAST(strftime('%s', {column}) AS INTEGER) ELSE {column} END"
+
+INTEGER_TS_TABLES = {
+    "incidents": ("""CREATE TABLE incidents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER,
+    source TEXT,
+    kind TEXT,
+    severity TEXT,
+    message TEXT,
+    data TEXT,
+    resolved BOOLEAN DEFAULT FALSE,
+    resolution TEXT,
+    fingerprint TEXT,
+    occurrences INTEGER DEFAULT 1,
+    last_seen INTEGER
+)""", ["id", "ts", "source", "kind", "severity", "message", "data", "resolved", "resolution", "fingerprint", "occurrences", "last_seen"],
+        {"ts": epoch_sql("ts"), "last_seen": f"COALESCE({epoch_sql('last_seen')}, {epoch_sql('ts')})"}),
+    "lessons": ("""CREATE TABLE lessons (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER,
+    category TEXT,
+    lesson TEXT,
+    confidence REAL DEFAULT 0.5,
+    applied_count INTEGER DEFAULT 0
+)""", ["id", "ts", "category", "lesson", "confidence", "applied_count"], {"ts": epoch_sql("ts")}),
+    "fixes": ("""CREATE TABLE fixes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER,
+    incident_id INTEGER,
+    fix_type TEXT,
+    fix_action TEXT,
+    success BOOLEAN,
+    result TEXT
+)""", ["id", "ts", "incident_id", "fix_type", "fix_action", "success", "result"], {"ts": epoch_sql("ts")}),
+    "performance_metrics": ("""CREATE TABLE performance_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER,
+    metric_name TEXT,
+    metric_value REAL,
+    context TEXT
+)""", ["id", "ts", "metric_name", "metric_value", "context"], {"ts": epoch_sql("ts")}),
+    "knowledge_base": ("""CREATE TABLE knowledge_base (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER,
+    topic TEXT,
+    content TEXT,
+    source TEXT,
+    reliability REAL DEFAULT 0.5
+)""", ["id", "ts", "topic", "content", "source", "reliability"], {"ts": epoch_sql("ts")}),
+}
+
+# Compressed columns. Encoded values are BLOBs whose first byte names the format, so
+# formats can be added without rewriting old rows; TEXT values (short values and rows
+# from older builds) read back unchanged. The shared dictionary primes deflate with the
+# JSON keys and prose that dominate incident data, fixes and lessons.
+#
+# FROZEN: rows tagged 2 were deflated against these exact bytes and cannot be read with
+# any others. Never edit this constant; a revised dictionary is a new constant under a
+# new tag (zlib-dict-v2), with v1 kept for decoding.
+CODEC_DICTIONARY_V1 = (
+    "Recommendation: Root cause: Next steps: Check the logs, environment variables and recent deployments. "
+    "Restart the service and verify the health endpoint. Monitor for recurrence. database connection timeout "
+    "NexteraEstate platform backend frontend API endpoint server Railway Vercel configuration incident pattern "
+    "occurred times in the last 24 hours. The site is down, degraded, healthy. "
+    '"status_code":200,"status_code":404,"status_code":500,"status_code":502,"status_code":503,'
+    '"error":"","ok":false,"ok":true,"response_ms":,"checked_at":"20","timestamp":"20","url":"https://'
+    '"timings":{"connect_ms":,"tls_ms":,"ttfb_ms":,"total_ms":},"target":"","severity":"critical",'
+    '"site":{"home":{"ok":,"auth":{"ok":,"api":{"health":{"ok":,"features":{},"targets":{"total":,'
+    '"checked":,"failing":[]},"overall_status":"healthy","overall_status":"degraded","overall_status":"down"}'
+).encode()
+CODEC_DICTIONARY_V1_SHA256 = "9d1dd639085ec555b60eabcf28dee73cd22523e756d3383a768a3be245c9cead"
+
+class ZlibFormat:
+    """Raw deflate, optionally primed with a preset dictionary"""
+
+    def __init__(self, zdict: Optional[bytes] = None, level: int = 6):
+        self.zdict = zdict
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        if self.zdict:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=self.zdict)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = zlib.decompressobj(-15, zdict=self.zdict) if self.zdict else zlib.decompressobj(-15)
+        return decompressor.decompress(data) + decompressor.flush()
+
+class ZstdFormat:
+    """zstd via the optional `zstandard` package"""
+
+    def __init__(self, level: int = 3):
+        import zstandard
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.decompressor.decompress(data)
+
+CODEC_TAGS = {"zlib": 1, "zlib-dict-v1": 2, "zstd": 3}
+# "zlib-dict" always means the newest dictionary
+CODEC_ALIASES = {"zlib-dict": "zlib-dict-v1"}
+
+class ColumnCodec:
+    """Transparent compression for large TEXT columns; decode() accepts every known format"""
+
+    def __init__(self, name: str = COLUMN_CODEC, min_size: int = COLUMN_CODEC_MIN_SIZE):
+        self.min_size = min_size
+        if hashlib.sha256(CODEC_DICTIONARY_V1).hexdigest() != CODEC_DICTIONARY_V1_SHA256:
+            raise RuntimeError("CODEC_DICTIONARY_V1 was modified; stored zlib-dict-v1 values would not decode")
+        self.formats: Dict[int, Any] = {1: ZlibFormat(), 2: ZlibFormat(CODEC_DICTIONARY_V1)}
+        if importlib.util.find_spec("zstandard") is not None:
+            self.formats[3] = ZstdFormat()
+        name = CODEC_ALIASES.get(name, name)
+        self.tag = CODEC_TAGS.get(name)
+        if self.tag is not None and self.tag not in self.formats:
+            logger.warning(f"⚠️ Column codec {name} unavailable - using {CODEC_ALIASES['zlib-dict']}")
+            self.tag = CODEC_TAGS[CODEC_ALIASES["zlib-dict"]]
+
+    def encode(self, text: Optional[str]) -> Any:
+        if text is None or self.tag is None or len(text) < self.min_size:
+            return text
+        raw = text.encode()
+        blob = bytes([self.tag]) + self.formats[self.tag].compress(raw)
+        return blob if len(blob) < len(raw) else text
+
+    def decode(self, value: Any) -> Any:
+        if isinstance(value, (bytes, memoryview)):
+            value = bytes(value)
+            fmt = self.formats.get(value[0])
+            if fmt is None:
+                raise ValueError(f"Unknown column codec format {value[0]}")
+            return fmt.decompress(value[1:]).decode()
+        return value
+
+    def encode_json(self, data: Any) -> Any:
+        """Compact JSON, encoded; oversized documents become a valid truncation marker, never cut JSON"""
+        text = json.dumps(data, separators=(",", ":"), default=str)
+        if len(text) > INCIDENT_DATA_MAX:
+            text = json.dumps({"truncated": True, "size": len(text), "preview": text[:INCIDENT_DATA_MAX // 2]},
+                              separators=(",", ":"))
+        return self.encode(text)
+
+column_codec = ColumnCodec()
+
+# Columns stored through column_codec; the agent's own SQL reads their text through decode_text()
+ENCODED_COLUMNS = {"incidents": ["data"], "lessons": ["lesson"], "fixes": ["fix_action"]}
+
+def encode_existing_columns(db: sqlite3.Connection):
+    """Migration step: encode TEXT values written before the codec, repairing cut-off incident JSON"""
+    for table, columns in ENCODED_COLUMNS.items():
+        for column in columns:
+            last_id = 0
+            while True:
+                rows = db.execute(
+                    f"SELECT id, {column} FROM {table} WHERE id > ? AND typeof({column}) = 'text' ORDER BY id LIMIT 1000",
+                    (last_id,)
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                updates = []
+                for row_id, text in rows:
+                    if table == "incidents":
+                        try:
+                            value = column_codec.encode_json(json.loads(text))
+                        except ValueError:
+                            value = column_codec.encode_json({"truncated": True, "preview": text})
+                    else:
+                        value = column_codec.encode(text)
+                    if value != text:
+                        updates.append((value, row_id))
+                db.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)
+
+# Full-text search: one FTS5 table over several sources. Rows are keyed as
+# id * 4 + code so triggers address them by rowid and results decode back to (kind, id).
+SEARCH_SOURCES = {
+    "lessons": (0, "lesson", ["category", "lesson"]),
+    "knowledge_base": (1, "knowledge", ["topic", "content"]),
+    "incidents": (2, "incident", ["source", "kind", "message"]),
+    "fixes": (3, "fix", ["fix_type", "fix_action", "result"]),
+}
+SEARCH_KINDS = {code: kind for code, kind, _ in SEARCH_SOURCES.values()}
+
+SEARCH_STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "all", "any", "can", "had", "her", "was", "one",
+    "our", "out", "has", "have", "how", "what", "when", "where", "which", "who", "why", "with", "this",
+    "that", "from", "they", "them", "there", "their", "been", "were", "will", "would", "should", "could",
+    "about", "into", "does", "did", "doing", "its", "your", "yours", "some", "than", "then", "just",
+}
+
+def search_body_sql(table: str, row: str, decode: bool) -> str:
+    """Indexed text of a `table` row. Encoded columns need decode_text(), which only the agent's
+    connections register; without it they contribute only values still stored as plain TEXT."""
+    encoded = ENCODED_COLUMNS.get(table, [])
+    def column_text(column: str) -> str:
+        if column not in encoded:
+            return f"coalesce({row}.{column}, '')"
+        if decode:
+            return f"coalesce(decode_text({row}.{column}), '')"
+        return f"CASE WHEN typeof({row}.{column}) = 'text' THEN {row}.{column} ELSE '' END"
+    return " || ' ' || ".join(column_text(column) for column in SEARCH_SOURCES[table][2])
+
+def search_reindex_sql(table: str) -> str:
+    """Rewrite one row's search_index entry with decoded text; parameter is the row id"""
+    code = SEARCH_SOURCES[table][0]
+    return (f"INSERT OR REPLACE INTO search_index(rowid, body) "
+            f"SELECT id * 4 + {code}, {search_body_sql(table, table, True)} FROM {table} WHERE id = ?")
+
+def search_index_sql(table: str) -> List[str]:
+    """Triggers keeping search_index in step with `table`, plus a backfill of its rows.
+
+    Triggers call no custom SQL functions, so the sqlite3 CLI and maintenance scripts
+    can still write these tables; the agent re-indexes encoded rows it writes itself
+    (AgentStorage.write_indexed).
+    """
+    code, _, columns = SEARCH_SOURCES[table]
+    def body(row: str) -> str:
+        return search_body_sql(table, row, decode=row == table)
+    changed = " OR ".join(f"old.{column} IS NOT new.{column}" for column in columns)
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+    INSERT INTO search_index(rowid, body) VALUES (new.id * 4 + {code}, {body('new')});
+END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {', '.join(columns)} ON {table}
+WHEN {changed} BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+    INSERT INTO search_index(rowid, body) VALUES (new.id * 4 + {code}, {body('new')});
+END""",
+        f"INSERT OR REPLACE INTO search_index(rowid, body) SELECT {table}.id * 4 + {code}, {body(table)} FROM {table}",
+    ]
+
+# Near-duplicate lessons: word-bigram shingles compared by Jaccard similarity.
+# Volatile numbers (timestamps, counts, durations) are folded so lessons differing only
+# in those match; HTTP status codes are kept, since a 502 lesson is not a 503 lesson.
+# A number only counts as a status code next to a status token ("http 502", "http_502",
+# "status: 503", "500 error"); "occurred 144 times" is a count like any other.
+STATUS_TOKENS = {"http", "status", "error", "code"}
+STATUS_BEFORE = re.compile(r"([a-z]+)(?:_|\s*[:=]?\s*)$")
+STATUS_AFTER = re.compile(r"\s*([a-z]+)")
+
+def fold_number(match: "re.Match") -> str:
+    number = match.group(0)
+    if not (number.isdigit() and len(number) == 3 and "100" <= number <= "599"):
+        return "0"
+    text = match.string
+    before = STATUS_BEFORE.search(text, max(0, match.start() - 16), match.start())
+    after = STATUS_AFTER.match(text, match.end())
+    if (before and before.group(1) in STATUS_TOKENS) or (after and after.group(1) in STATUS_TOKENS):
+        return number
+    return "0"
+
+def lesson_shingles(text: str, k: int = 2) -> set:
+    folded = re.sub(r"\d+(?:\.\d+)*", fold_number, (text or "").lower())
+    words = [w for w in re.findall(r"\w+", folded) if w not in SEARCH_STOPWORDS]
+    if len(words) < k:
+        return set(words)
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+def shingle_codes(shingles: set) -> set:
+    return {code for shingle in shingles for code in re.findall(r"\d+", shingle) if code != "0"}
+
+def near_duplicate(a: set, b: set) -> bool:
+    """Similar enough to merge, and naming the same status codes"""
+    return jaccard(a, b) >= LESSON_SIMILARITY and shingle_codes(a) == shingle_codes(b)
+
+def reinforce(confidence: Optional[float], incoming: Optional[float]) -> float:
+    """Confidence of a lesson seen again: the stronger of the two, moved part way towards 1"""
+    base = max(confidence or 0.0, incoming or 0.0)
+    return round(min(1.0, base + (1.0 - base) * LESSON_REINFORCEMENT), 4)
+
+MINHASH_BANDS, MINHASH_ROWS = 8, 4  # candidate pairs from ~0.6 Jaccard upwards
+MINHASH_PRIME = (1 << 61) - 1
+MINHASH_SEEDS = [(random.Random(i).randrange(1, MINHASH_PRIME), random.Random(-i - 1).randrange(MINHASH_PRIME))
+                 for i in range(MINHASH_BANDS * MINHASH_ROWS)]
+
+def minhash_bands(shingles: set) -> List[tuple]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles] or [0]
+    signature = [min((a * h + b) % MINHASH_PRIME for h in hashes) for a, b in MINHASH_SEEDS]
+    return [tuple(signature[i * MINHASH_ROWS:(i + 1) * MINHASH_ROWS]) for i in range(MINHASH_BANDS)]
+
+def compact_lessons(db: sqlite3.Connection) -> Dict[str, int]:
+    """Fold near-duplicate lessons into the oldest one per category.
+
+    MinHash LSH bands propose candidates so the pass stays near linear; each candidate
+    is confirmed with exact Jaccard before merging. Kept rows gain the duplicates'
+    applied counts plus one per duplicate, and reinforced confidence.
+    """
+    kept: Dict[int, list] = {}
+    buckets: Dict[tuple, List[int]] = {}
+    duplicates = []
+    rows = db.execute("SELECT id, category, lesson, confidence, applied_count FROM lessons ORDER BY id").fetchall()
+    for lesson_id, category, lesson, confidence, applied_count in rows:
+        shingles = lesson_shingles(column_codec.decode(lesson))
+        bands = minhash_bands(shingles)
+        candidates = {kept_id for i, band in enumerate(bands) for kept_id in buckets.get((category, i, band), [])}
+        match = next((c for c in sorted(candidates) if near_duplicate(shingles, kept[c][0])), None)
+        if match is not None:
+            entry = kept[match]
+            entry[1] = reinforce(entry[1], confidence)
+            entry[2] += (applied_count or 0) + 1
+            entry[3] = True
+            duplicates.append((lesson_id,))
+            continue
+        kept[lesson_id] = [shingles, confidence, applied_count or 0, False]
+        for i, band in enumerate(bands):
+            buckets.setdefault((category, i, band), []).append(lesson_id)
+    db.executemany("UPDATE lessons SET confidence = ?, applied_count = ? WHERE id = ?",
+                   [(entry[1], entry[2], lesson_id) for lesson_id, entry in kept.items() if entry[3]])
+    db.executemany("DELETE FROM lessons WHERE id = ?", duplicates)
+    stats = {"scanned": len(rows), "merged": len(duplicates), "kept": len(kept)}
+    logger.info(f"🧹 Lesson compaction: {stats}")
+    return stats
+
+# (version, description, steps) - applied in order and recorded in PRAGMA user_version.
+# Steps are idempotent so databases written by pre-versioned builds upgrade cleanly.
+MIGRATIONS = [
+    (1, "baseline schema", BASELINE_SCHEMA),
+    (2, "llm cache and probe registry tables", [
+        """CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    mode TEXT,
+    response TEXT,
+    expires_at REAL
+)""",
+        """CREATE TABLE IF NOT EXISTS probe_targets (
+    name TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    method TEXT,
+    expect_status TEXT,
+    body_contains TEXT,
+    body_regex TEXT,
+    interval REAL,
+    timeout REAL,
+    severity TEXT,
+    enabled BOOLEAN
+)""",
+    ]),
+    (3, "incident fingerprint columns", [
+        add_columns("incidents", {"fingerprint": "TEXT", "occurrences": "INTEGER DEFAULT 1", "last_seen": "TEXT"}),
+    ]),
+    (4, "integer epoch timestamps", [
+        rebuild_table(table, create_sql, columns, conversions)
+        for table, (create_sql, columns, conversions) in INTEGER_TS_TABLES.items()
+    ]),
+    (5, "indexes for time-range and ranking queries", [
+        "CREATE INDEX IF NOT EXISTS idx_incidents_ts ON incidents(ts)",
+        "CREATE INDEX IF NOT EXISTS idx_incidents_last_seen ON incidents(last_seen)",
+        "CREATE INDEX IF NOT EXISTS idx_incidents_open_fingerprint ON incidents(fingerprint) WHERE resolved = FALSE",
+        "CREATE INDEX IF NOT EXISTS idx_incidents_open_source ON incidents(source, kind) WHERE resolved = FALSE",
+        "CREATE INDEX IF NOT EXISTS idx_lessons_confidence ON lessons(confidence DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_reliability ON knowledge_base(reliability DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_fixes_incident ON fixes(incident_id)",
+        "CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at)",
+    ]),
+    (6, "probe latency rollup tiers", [
+        """CREATE TABLE IF NOT EXISTS metric_rollups (
+    tier TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    count INTEGER,
+    sum REAL,
+    min REAL,
+    max REAL,
+    PRIMARY KEY (tier, target, metric, bucket)
+) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_rollups_tier_bucket ON metric_rollups(tier, bucket)",
+        "CREATE INDEX IF NOT EXISTS idx_metrics_ts ON performance_metrics(ts)",
+        "CREATE INDEX IF NOT EXISTS idx_metrics_series ON performance_metrics(context, metric_name, ts)",
+    ]),
+    (7, "worker leases and shared agent state", [
+        """CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+)""",
+        """CREATE TABLE IF NOT EXISTS agent_state (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    updated_at REAL NOT NULL
+)""",
+    ]),
+    (8, "event relay log", [
+        """CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER NOT NULL,
+    origin TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT
+)""",
+        "CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)",
+    ]),
+    (9, "full-text search index", [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(body, tokenize = 'porter unicode61')",
+        *(statement for table in SEARCH_SOURCES for statement in search_index_sql(table)),
+    ]),
+    (10, "consolidate near-duplicate lessons", [
+        compact_lessons,
+    ]),
+    (11, "compressed incident data, lessons and fixes", [
+        encode_existing_columns,
+        # Re-index with decoded text: the update triggers only see plain TEXT values
+        *(search_index_sql(table)[3] for table in ["lessons", "fixes"]),
+    ]),
+    (12, "search triggers without custom SQL functions", [
+        *(f"DROP TRIGGER IF EXISTS {table}_search_{action}" for table in ["lessons", "fixes"] for action in ["insert", "update"]),
+        *(statement for table in ["lessons", "fixes"] for statement in search_index_sql(table)[:3]),
+    ]),
+]
+
+class AgentStorage:
+    """SQLite storage: WAL journal, one group-committing writer thread, per-call readers"""
+
+    def __init__(self, path: str, batch_size: int = DB_BATCH_SIZE, functions: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.batch_size = batch_size
+        self.functions = functions or {}
+        self.queue: "queue.Queue" = queue.Queue()
+        self.writer = self.connect(check_same_thread=False)
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.rows_written = 0
+        self.commits = 0
+        self.write_seconds = 0.0
+        self.thread: Optional[threading.Thread] = None
+
+    def connect(self, **kwargs) -> sqlite3.Connection:
+        """Connection with the SQL functions that triggers and queries rely on"""
+        db = sqlite3.connect(self.path, timeout=30, **kwargs)
+        for name, function in self.functions.items():
+            db.create_function(name, 1, function, deterministic=True)
+        return db
+
+    def migrate(self, migrations: List[tuple]) -> int:
+        """Apply pending migrations before the writer thread takes ownership of the connection"""
+        version = self.writer.execute("PRAGMA user_version").fetchone()[0]
+        for target, description, steps in migrations:
+            if target <= version:
+                continue
+            try:
+                # IMMEDIATE takes the write lock up front so concurrently starting workers
+                # queue here, then re-read the version another worker may have advanced
+                self.writer.execute("BEGIN IMMEDIATE")
+                version = self.writer.execute("PRAGMA user_version").fetchone()[0]
+                if target <= version:
+                    self.writer.rollback()
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(self.writer)
+                    else:
+                        self.writer.execute(step)
+                self.writer.execute(f"PRAGMA user_version = {int(target)}")
+                self.writer.commit()
+            except Exception:
+                self.writer.rollback()
+                logger.error(f"❌ Migration {target} ({description}) failed")
+                raise
+            version = target
+            logger.info(f"🗄️ Applied migration {target}: {description}")
+        return version
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._writer_loop, name="agent-db-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, sql: str, params: tuple = ()) -> concurrent.futures.Future:
+        """Queue a write; the future resolves to lastrowid (INSERT) or rowcount once committed"""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self.queue.put((sql, params, future, False, current_span.get()))
+        return future
+
+    def submit_many(self, sql: str, rows: List[tuple]) -> concurrent.futures.Future:
+        """Queue an executemany; the future resolves to the number of rows affected"""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self.queue.put((sql, rows, future, True, current_span.get()))
+        return future
+
+    async def write(self, sql: str, params: tuple = ()) -> int:
+        """Queue a write and wait for the group commit that contains it"""
+        with tracer.span("sqlite.write", statement=sql.split(None, 1)[0].upper()):
+            return await asyncio.wrap_future(self.submit(sql, params))
+
+    async def write_indexed(self, table: str, sql: str, params: tuple = ()) -> int:
+        """INSERT into a searched table with encoded columns, then index the row's decoded text"""
+        row_id = await self.write(sql, params)
+        await self.write(search_reindex_sql(table), (row_id,))
+        return row_id
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Run a read on its own short-lived connection (WAL readers never block the writer)"""
+        reader = self.connect()
+        try:
+            return reader.execute(sql, params).fetchall()
+        finally:
+            reader.close()
+
+    def _writer_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stop = False
+            # Drain whatever queued up while the previous commit was flushing
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+            if stop:
+                break
+
+    def _commit_batch(self, batch: List[tuple]):
+        started = time.perf_counter()
+        cursor = self.writer.cursor()
+        results = []
+        rows = 0
+        for sql, params, future, many, _ in batch:
+            try:
+                if many:
+                    cursor.executemany(sql, params)
+                    results.append((future, cursor.rowcount, None))
+                    rows += max(cursor.rowcount, 0)
+                    continue
+                cursor.execute(sql, params)
+                is_insert = sql.lstrip()[:6].upper() == "INSERT"
+                results.append((future, cursor.lastrowid if is_insert else cursor.rowcount, None))
+                rows += 1
+            except Exception as e:
+                results.append((future, None, e))
+        try:
+            self.writer.commit()
+        except Exception as e:
+            logger.error(f"❌ Database commit failed: {e}")
+            self.writer.rollback()
+            results = [(future, None, e) for future, _, _ in results]
+            rows = 0
+
+        elapsed = time.perf_counter() - started
+        self.commits += 1
+        self.rows_written += rows
+        self.write_seconds += elapsed
+        DB_COMMITS.inc()
+        DB_ROWS.inc(rows)
+        DB_COMMIT_DURATION.observe(elapsed)
+        
+        # The commit shows up under every traced write it carried, on the writer thread's row
+        for parent in {id(item[4]): item[4] for item in batch if item[4] is not None}.values():
+            tracer.record("sqlite.commit", parent, elapsed, batch=len(batch), rows=rows)
+
+        for future, value, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "journal_mode": "wal",
+            "rows_written": self.rows_written,
+            "commits": self.commits,
+            "rows_per_commit": round(self.rows_written / self.commits, 2) if self.commits else 0.0,
+            "rows_per_sec": round(self.rows_written / self.write_seconds, 1) if self.write_seconds else 0.0,
+            "queue_depth": self.queue.qsize(),
+        }
+
+    def close(self):
+        """Flush queued writes and stop the writer"""
+        if self.thread and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=30)
+        self.writer.close()
 
-conn.commit()
+storage = AgentStorage(DB_PATH, functions={"decode_text": column_codec.decode})
+storage.migrate(MIGRATIONS)
+DB_QUEUE_DEPTH.set_function(storage.queue.qsize)
+storage.start()
+
+def format_sse(message: Dict[str, Any]) -> str:
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+
+class EventBus:
+    """In-process fan-out of agent events to stream subscribers.
+
+    Each subscriber gets a bounded queue. One that falls behind has its backlog replaced
+    by a single "resync" event, so a slow dashboard costs memory proportional to the queue
+    size and is told to refetch instead of silently missing updates. Events are also
+    appended to the `events` table, from which every worker relays what the others published.
+    """
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE, relay_interval: float = EVENT_RELAY_INTERVAL):
+        self.queue_size = queue_size
+        self.relay_interval = relay_interval
+        self.origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.subscribers: set = set()
+        self.sequence = 0
+        self.published = 0
+        self.relayed = 0
+        self.resyncs = 0
+        self.last_relayed_id = 0
+        self.last_prune = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def subscribe(self) -> "asyncio.Queue":
+        subscriber: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: "asyncio.Queue"):
+        self.subscribers.discard(subscriber)
+
+    def _fanout(self, event: str, data: Dict[str, Any]):
+        self.sequence += 1
+        message = {"id": self.sequence, "event": event, "data": data}
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait(message)
+            except asyncio.QueueFull:
+                dropped = subscriber.qsize()
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait({"id": self.sequence, "event": "resync", "data": {"dropped": dropped + 1}})
+                EVENTS_DROPPED.inc(dropped + 1)
+                self.resyncs += 1
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        """Deliver to local subscribers now and log for the other workers; call from the event loop"""
+        data = {"ts": ts_to_iso(now_ts()), **data}
+        self._fanout(event, data)
+        self.published += 1
+        EVENTS_PUBLISHED.inc(event=event, origin="local")
+        storage.submit(
+            "INSERT INTO events (ts, origin, event, data) VALUES (?, ?, ?, ?)",
+            (now_ts(), self.origin, event, json.dumps(data, default=str))
+        )
+
+    def relay(self):
+        """Forward events other workers logged since the last call"""
+        if not self.subscribers:
+            # Nobody listening: skip ahead instead of reading rows no one will see
+            self.last_relayed_id = storage.query("SELECT COALESCE(MAX(id), 0) FROM events")[0][0]
+            return
+        rows = storage.query(
+            "SELECT id, event, data FROM events WHERE id > ? AND origin != ? ORDER BY id LIMIT 500",
+            (self.last_relayed_id, self.origin)
+        )
+        for row_id, event, data in rows:
+            self._fanout(event, json.loads(data) if data else {})
+            self.relayed += 1
+            EVENTS_PUBLISHED.inc(event=event, origin="relay")
+        if rows:
+            self.last_relayed_id = rows[-1][0]
+
+    async def run_forever(self):
+        self.last_relayed_id = storage.query("SELECT COALESCE(MAX(id), 0) FROM events")[0][0]
+        while True:
+            await asyncio.sleep(self.relay_interval)
+            try:
+                self.relay()
+                if time.monotonic() - self.last_prune > 600:
+                    self.last_prune = time.monotonic()
+                    storage.submit("DELETE FROM events WHERE ts < ?", (now_ts() - EVENT_RETENTION,))
+            except Exception as e:
+                logger.error(f"❌ Event relay failed: {e}")
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "relayed": self.relayed,
+            "resyncs": self.resyncs,
+        }
+
+event_bus = EventBus()
+EVENT_SUBSCRIBERS.set_function(lambda: len(event_bus.subscribers))
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """Fails fast after repeated failures and probes for recovery.
+
+    Closed: calls pass; `threshold` consecutive failures open the circuit. Open: calls are
+    rejected until the cooldown passes. Half-open: one trial call goes through; success
+    closes the circuit, failure reopens it with the cooldown doubled (up to `max_cooldown`).
+    """
+
+    STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, name: str, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.trips = 0
+        self.rejected = 0
+        BREAKER_STATE.set(0, breaker=name)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"🔌 Circuit {self.name}: {self.state} -> {state}")
+        self.state = state
+        BREAKER_STATE.set(self.STATE_VALUES[state], breaker=self.name)
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit lets a trial call through"""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def available(self) -> bool:
+        """Whether a call made now could go through, without claiming the half-open trial"""
+        return self.state == "closed" or (self.state == "open" and self.retry_in() == 0) or (
+            self.state == "half_open" and not self.trial_running)
+
+    def allow(self) -> bool:
+        """Claim permission for one call; False means fail fast"""
+        if self.state == "open" and self.retry_in() == 0:
+            self._set_state("half_open")
+            self.trial_running = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        self.rejected += 1
+        BREAKER_REJECTIONS.inc(breaker=self.name)
+        return False
+
+    def release(self):
+        """Give back a half-open trial that ended without a verdict (e.g. cancelled)"""
+        self.trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_running = False
+        self.cooldown = self.base_cooldown
+        self._set_state("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        elif self.failures < self.threshold:
+            return
+        self.trial_running = False
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._set_state("open")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": round(self.retry_in(), 1),
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+llm_breaker = CircuitBreaker("llm", threshold=LLM_BREAKER_THRESHOLD, cooldown=LLM_BREAKER_COOLDOWN)
+
+LLM_SYSTEM_PROMPTS = {
+    "analyze": """You are a senior software engineer analyzing NexteraEstate production issues. 
+                Provide clear, actionable analysis in plain language. Focus on:
+                1. Root cause
+                2. Immediate fix
+                3. Prevention strategy
+                Be direct and specific. Keep under 200 words.""",
+    "fix": """You are an expert DevOps engineer providing fix instructions for NexteraEstate.
+                Give step-by-step solutions in plain language. Include:
+                1. Exact commands or code changes
+                2. Expected results
+                3. How to verify the fix worked
+                Be precise and actionable. Keep under 200 words.""",
+    "learn": """You are a tech lead extracting lessons from NexteraEstate incidents.
+                Identify patterns and create rules to prevent future issues. Focus on:
+                1. What pattern led to this issue
+                2. How to detect it early
+                3. Automated prevention measures
+                Be strategic and forward-thinking. Keep under 200 words.""",
+}
+
+class LLMClient:
+    """Gemini client built once; blocking SDK calls run on a bounded thread pool off the event loop"""
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY):
+        self.model = None
+        self.model_lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm")
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+
+    def get_model(self):
+        with self.model_lock:
+            if self.model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                self.model = genai.GenerativeModel(LLM_MODEL)
+            return self.model
+
+    def _generate(self, prompt: str, timeout: float) -> str:
+        response = self.get_model().generate_content(prompt, request_options={"timeout": timeout})
+        return response.text
+
+    async def _start(self, function, *args) -> asyncio.Future:
+        """Run `function` on the pool, holding a slot until the worker thread itself returns"""
+        await self.semaphore.acquire()
+        self.in_flight += 1
+        
+        def release(future: asyncio.Future):
+            self.in_flight -= 1
+            self.semaphore.release()
+            if not future.cancelled():
+                future.exception()  # mark retrieved when the caller stopped waiting
+        
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        except BaseException:
+            self.in_flight -= 1
+            self.semaphore.release()
+            raise
+        future.add_done_callback(release)
+        return future
+
+    async def generate(self, prompt: str, timeout: float = LLM_TIMEOUT) -> str:
+        """Run one completion with a deadline covering queueing and the round-trip.
+
+        Cancelling the awaiting task (client disconnect, shutdown) returns at once, but the
+        slot stays taken until the SDK call finishes, bounded by its own request timeout.
+        """
+        async def call():
+            return await asyncio.shield(await self._start(self._generate, prompt, timeout))
+        return await asyncio.wait_for(call(), timeout)
+
+    def _stream(self, prompt: str, timeout: float, emit, stop: threading.Event):
+        if stop.is_set():
+            return
+        response = self.get_model().generate_content(prompt, stream=True, request_options={"timeout": timeout})
+        for chunk in response:
+            if stop.is_set():
+                break
+            if chunk.text:
+                emit(chunk.text)
+
+    async def stream(self, prompt: str, timeout: float = LLM_TIMEOUT):
+        """Yield text chunks as the model produces them, under the same slot limit and deadline as generate().
+
+        A worker thread iterates the SDK's streaming response and hands chunks to the loop;
+        closing the generator early tells the thread to stop at the next chunk, and the slot
+        is released only once the thread has actually stopped.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        chunks: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+        
+        def emit(item):
+            try:
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+            except RuntimeError:
+                stop.set()  # loop already closed
+        
+        def produce():
+            try:
+                self._stream(prompt, timeout, emit, stop)
+                emit(done)
+            except Exception as e:
+                emit(e)
+        
+        await asyncio.wait_for(self._start(produce), timeout)
+        try:
+            while True:
+                item = await asyncio.wait_for(chunks.get(), max(0.0, deadline - loop.time()))
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+llm_client = LLMClient()
+
+class PromptCache:
+    """TTL + LRU cache of LLM responses keyed on mode and whitespace-normalized prompt"""
+
+    def __init__(self, ttl: float = LLM_CACHE_TTL, max_size: int = LLM_CACHE_SIZE, persist: bool = LLM_CACHE_PERSIST):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.persist = persist
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(prompt: str, mode: str) -> str:
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(f"{mode}\0{normalized}".encode()).hexdigest()
+
+    def load(self):
+        """Warm the cache with unexpired rows persisted by previous runs"""
+        if not self.persist:
+            return
+        now = time.time()
+        storage.submit("DELETE FROM llm_cache WHERE expires_at < ?", (now,))
+        rows = storage.query(
+            "SELECT key, response, expires_at FROM llm_cache WHERE expires_at >= ? ORDER BY expires_at DESC LIMIT ?",
+            (now, self.max_size)
+        )
+        for key, response, expires_at in reversed(rows):
+            self.entries[key] = (expires_at, response)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.time():
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            LLM_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        LLM_CACHE_LOOKUPS.inc(result="hit")
+        return entry[1]
+
+    def put(self, key: str, mode: str, response: str):
+        expires_at = time.time() + self.ttl
+        self.entries[key] = (expires_at, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        if self.persist:
+            storage.submit(
+                "INSERT OR REPLACE INTO llm_cache(key,mode,response,expires_at) VALUES(?,?,?,?)",
+                (key, mode, response, expires_at)
+            )
+            # Keep the table as bounded as the memory cache: drop expired rows, then all but the newest
+            storage.submit(
+                "DELETE FROM llm_cache WHERE expires_at < ? OR key NOT IN "
+                "(SELECT key FROM llm_cache ORDER BY expires_at DESC LIMIT ?)",
+                (time.time(), self.max_size)
+            )
+
+    async def get_or_compute(self, key: str, mode: str, compute) -> str:
+        """Serve from cache, or run compute() once even if several callers miss together"""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        if key in self.pending:
+            pending = self.pending[key]
+            await asyncio.wait([pending])
+            if not pending.cancelled():
+                return pending.result()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            response = await compute()
+            self.put(key, mode, response)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self.pending.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+prompt_cache = PromptCache()
+
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+def incident_error_class(data: Dict[str, Any]) -> str:
+    """Reduce probe details to a stable error class: failing HTTP status or error text minus volatile numbers"""
+    candidates = [data] + [value for value in data.values() if isinstance(value, dict)]
+    for value in candidates:
+        if value.get("status_code") is not None and not value.get("ok", False):
+            return f"http_{value['status_code']}"
+    for value in candidates:
+        if value.get("error"):
+            return re.sub(r"\d+", "#", " ".join(str(value["error"]).lower().split()))[:80]
+    return ""
+
+def incident_fingerprint(source: str, kind: str, error_class: str) -> str:
+    return hashlib.sha1(f"{source}|{kind}|{error_class}".encode()).hexdigest()[:16]
+
+class SlidingWindow:
+    """Event count over a trailing window, kept as fixed-width buckets plus a running total"""
+
+    def __init__(self, width: int, bucket: int):
+        self.width = width
+        self.bucket = bucket
+        self.buckets: deque = deque()
+        self.total = 0
+
+    def add(self, ts: int, count: int = 1):
+        start = ts - ts % self.bucket
+        if self.buckets and self.buckets[-1][0] == start:
+            self.buckets[-1][1] += count
+        elif not self.buckets or self.buckets[-1][0] < start:
+            self.buckets.append([start, count])
+        else:
+            # Late event (clock skew, rebuild order): fold into the newest bucket
+            self.buckets[-1][1] += count
+        self.total += count
+
+    def load(self, counts: Dict[int, int]):
+        """Replace the contents with precomputed per-bucket counts"""
+        self.buckets = deque([start, counts[start]] for start in sorted(counts) if counts[start])
+        self.total = sum(count for _, count in self.buckets)
+
+    def count(self, now: int) -> int:
+        cutoff = now - self.width
+        while self.buckets and self.buckets[0][0] + self.bucket <= cutoff:
+            self.total -= self.buckets.popleft()[1]
+        return self.total
+
+def spread_occurrences(buckets: Dict[int, int], first: float, step: float, occurrences: int, cutoff: int, bucket: int):
+    """Add occurrences at int(first + i * step) later than `cutoff` to per-bucket counts"""
+    if step <= 0:
+        if int(first) > cutoff:
+            start = int(first) - int(first) % bucket
+            buckets[start] = buckets.get(start, 0) + occurrences
+        return
+    # Occurrence i lands at or after t exactly when i >= (t - first) / step
+    def index(t: int) -> int:
+        return min(occurrences, max(0, math.ceil((t - first) / step)))
+    low = index(cutoff + 1)
+    while low < occurrences:
+        ts = int(first + low * step)
+        start = ts - ts % bucket
+        high = max(low + 1, index(start + bucket))
+        buckets[start] = buckets.get(start, 0) + high - low
+        low = high
+
+# window name -> (width seconds, bucket seconds)
+PATTERN_WINDOWS = {"1h": (3600, 60), "24h": (86400, 900), "7d": (7 * 86400, 3600)}
+
+class PatternAggregator:
+    """Per source/kind incident counts over 1h/24h/7d, updated on every occurrence.
+
+    Queries cost O(patterns) regardless of how much incident history is stored.
+    """
+
+    def __init__(self):
+        self.windows: Dict[str, Dict[str, SlidingWindow]] = {}
+        self.severity: Dict[str, str] = {}
+
+    def record(self, source: str, kind: str, severity: str, ts: Optional[int] = None):
+        key = f"{source}_{kind}"
+        ts = ts or now_ts()
+        if key not in self.windows:
+            self.windows[key] = {name: SlidingWindow(width, bucket) for name, (width, bucket) in PATTERN_WINDOWS.items()}
+        for window in self.windows[key].values():
+            window.add(ts)
+        if SEVERITY_RANK.get(severity, 1) >= SEVERITY_RANK.get(self.severity.get(key), -1):
+            self.severity[key] = severity
+
+    def rebuild(self):
+        """Replay the last 7 days of incidents"""
+        self.windows, self.severity = self.replay()
+
+    def replay(self) -> tuple:
+        """Windows and severities rebuilt from storage, without touching the live ones.
+
+        Coalesced rows only keep first/last seen and a count, so their occurrences are
+        spread evenly across that span - exact for fixed-interval probe failures. Each
+        row is split across buckets arithmetically, O(buckets) however many occurrences
+        it holds. Safe to run on a worker thread.
+        """
+        now = now_ts()
+        cutoff = now - PATTERN_WINDOWS["7d"][0]
+        # Only buckets still overlapping each window survive the first count(); skip the rest
+        starts = {name: max(cutoff, (now - width) // bucket * bucket - 1) for name, (width, bucket) in PATTERN_WINDOWS.items()}
+        counts: Dict[str, Dict[str, Dict[int, int]]] = {}
+        severities: Dict[str, str] = {}
+        for source, kind, severity, first, last, occurrences in storage.query(
+            "SELECT source, kind, severity, ts, last_seen, occurrences FROM incidents WHERE last_seen > ?", (cutoff,)
+        ):
+            key = f"{source}_{kind}"
+            occurrences = occurrences or 1
+            first = first if first is not None else last
+            step = (last - first) / (occurrences - 1) if occurrences > 1 else 0
+            per_window = counts.setdefault(key, {name: {} for name in PATTERN_WINDOWS})
+            for name, (_, bucket) in PATTERN_WINDOWS.items():
+                spread_occurrences(per_window[name], first, step, occurrences, starts[name], bucket)
+            if SEVERITY_RANK.get(severity, 1) >= SEVERITY_RANK.get(severities.get(key), -1):
+                severities[key] = severity
+        windows = {}
+        for key, per_window in counts.items():
+            windows[key] = {}
+            for name, (width, bucket) in PATTERN_WINDOWS.items():
+                window = SlidingWindow(width, bucket)
+                window.load(per_window[name])
+                windows[key][name] = window
+        return windows, severities
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = now_ts()
+        patterns = {}
+        for key, windows in list(self.windows.items()):
+            counts = {name: window.count(now) for name, window in windows.items()}
+            if not counts["7d"]:
+                del self.windows[key]
+                self.severity.pop(key, None)
+                continue
+            patterns[key] = {
+                "count": counts["24h"],
+                "count_1h": counts["1h"],
+                "count_24h": counts["24h"],
+                "count_7d": counts["7d"],
+                "severity": self.severity.get(key, "medium"),
+                "recent": counts["24h"] > 0
+            }
+        return patterns
 
 class TechDirector:
     def __init__(self):
         self.learning_enabled = LEARNING_MODE
         self.auto_fix_enabled = AUTO_FIX_MODE
-        self.knowledge = self.load_knowledge()
         self.startup_time = datetime.utcnow()
-        print(f"🧠 Tech Director initialized with {len(self.knowledge)} knowledge topics")
-        
-    def load_knowledge(self) -> Dict[str, Any]:
-        """Load accumulated knowledge from database"""
-        cur.execute("SELECT topic, content, reliability FROM knowledge_base ORDER BY reliability DESC")
-        knowledge = {}
-        for topic, content, reliability in cur.fetchall():
-            if topic not in knowledge:
-                knowledge[topic] = []
-            knowledge[topic].append({"content": content, "reliability": reliability})
-        return knowledge
-    
-    def save_incident(self, source: str, kind: str, severity: str, message: str, data: Dict[str, Any]):
+        self.incident_lock = asyncio.Lock()
+        self.lesson_lock = asyncio.Lock()
+        self.patterns = PatternAggregator()
+        self.patterns.rebuild()
+        print(f"🧠 Tech Director initialized with {self.knowledge_topics()} knowledge topics")
+        
+    def knowledge_topics(self) -> int:
+        """Knowledge is read on demand through the search index; only the topic count is kept here"""
+        return storage.query("SELECT COUNT(DISTINCT topic) FROM knowledge_base")[0][0]
+    
+    async def save_incident(self, source: str, kind: str, severity: str, message: str, data: Dict[str, Any]) -> int:
         """Save incident with enhanced metadata"""
-        cur.execute(
-            "INSERT INTO incidents(ts,source,kind,severity,message,data) VALUES (?,?,?,?,?,?)",
-            (datetime.utcnow().isoformat(), source, kind, severity, message, json.dumps(data)[:8000])
-        )
-        conn.commit()
-        logger.info(f"🚨 Incident recorded: {source}.{kind} - {message}")
-        return cur.lastrowid
-    
-    def add_lesson(self, category: str, lesson: str, confidence: float = 0.7):
-        """Add lesson with confidence scoring"""
-        cur.execute(
-            "INSERT INTO lessons(ts,category,lesson,confidence) VALUES(?,?,?,?)",
-            (datetime.utcnow().isoformat(), category, lesson, confidence)
+        return (await self.record_incident(source, kind, severity, message, data))["id"]
+    
+    @tracer.traced("incident.record")
+    async def record_incident(self, source: str, kind: str, severity: str, message: str,
+                              data: Dict[str, Any], key: Optional[str] = None) -> Dict[str, Any]:
+        """Fold repeats of an open incident into one row and report the transition.
+
+        Incidents are fingerprinted by source, kind and error class (or an explicit key).
+        The transition is "opened" for a new row, "escalated" when severity rises or the
+        occurrence count reaches INCIDENT_ESCALATE_AFTER, otherwise "ongoing".
+        """
+        fingerprint = incident_fingerprint(source, kind, key if key is not None else incident_error_class(data))
+        now = now_ts()
+        payload = column_codec.encode_json(data)
+        
+        async with self.incident_lock:
+            rows = storage.query(
+                "SELECT id, severity, occurrences FROM incidents WHERE fingerprint = ? AND resolved = FALSE ORDER BY id DESC LIMIT 1",
+                (fingerprint,)
+            )
+            if not rows:
+                incident_id = await storage.write(
+                    "INSERT INTO incidents(ts,source,kind,severity,message,data,fingerprint,occurrences,last_seen) VALUES (?,?,?,?,?,?,?,1,?)",
+                    (now, source, kind, severity, message, payload, fingerprint, now)
+                )
+                self.patterns.record(source, kind, severity, now)
+                INCIDENTS.inc(source=source, transition="opened")
+                logger.info(f"🚨 Incident recorded: {source}.{kind} - {message}")
+                event_bus.publish("incident", {"id": incident_id, "transition": "opened", "source": source, "kind": kind,
+                                               "severity": severity, "message": message, "occurrences": 1})
+                return {"id": incident_id, "transition": "opened", "occurrences": 1, "severity": severity}
+            
+            incident_id, current_severity, occurrences = rows[0]
+            occurrences = (occurrences or 1) + 1
+            raised = SEVERITY_RANK.get(severity, 1) > SEVERITY_RANK.get(current_severity, 1)
+            if not raised:
+                severity = current_severity
+            await storage.write(
+                "UPDATE incidents SET occurrences = ?, last_seen = ?, severity = ?, message = ?, data = ? WHERE id = ?",
+                (occurrences, now, severity, message, payload, incident_id)
+            )
+            self.patterns.record(source, kind, severity, now)
+        
+        if raised or occurrences == INCIDENT_ESCALATE_AFTER:
+            logger.warning(f"📈 Incident {incident_id} escalated: {source}.{kind} x{occurrences} ({severity})")
+            transition = "escalated"
+        else:
+            transition = "ongoing"
+        INCIDENTS.inc(source=source, transition=transition)
+        # Repeats of an open incident are not news; subscribers only hear about escalations
+        if transition == "escalated":
+            event_bus.publish("incident", {"id": incident_id, "transition": transition, "source": source, "kind": kind,
+                                           "severity": severity, "message": message, "occurrences": occurrences})
+        return {"id": incident_id, "transition": transition, "occurrences": occurrences, "severity": severity}
+    
+    @tracer.traced("incident.resolve")
+    async def resolve_open(self, source: str, kind: str, resolution: str, key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Resolve open incidents for source/kind (optionally one fingerprint key) and return them"""
+        query = "SELECT id, ts, last_seen, occurrences FROM incidents WHERE source = ? AND kind = ? AND resolved = FALSE"
+        params: tuple = (source, kind)
+        if key is not None:
+            query += " AND fingerprint = ?"
+            params += (incident_fingerprint(source, kind, key),)
+        
+        resolved = []
+        async with self.incident_lock:
+            for incident_id, opened, last_seen, occurrences in storage.query(query, params):
+                await self.resolve_incident(incident_id, resolution)
+                resolved.append({"id": incident_id, "opened": ts_to_iso(opened), "last_seen": ts_to_iso(last_seen), "occurrences": occurrences or 1})
+        for incident in resolved:
+            logger.info(f"✅ Incident {incident['id']} auto-resolved: {source}.{kind} after {incident['occurrences']} occurrences")
+        return resolved
+    
+    def similar_lesson(self, category: str, lesson: str) -> Optional[tuple]:
+        """(id, confidence, applied_count) of an existing near-duplicate in the same category"""
+        query = fts_query(lesson)
+        if not query:
+            return None
+        shingles = lesson_shingles(lesson)
+        rows = storage.query(
+            "SELECT l.id, l.lesson, l.confidence, l.applied_count FROM search_index s JOIN lessons l ON l.id = s.rowid / 4 "
+            "WHERE search_index MATCH ? AND s.rowid % 4 = 0 AND l.category = ? ORDER BY s.rank LIMIT ?",
+            (query, category, LESSON_DEDUP_CANDIDATES)
         )
-        conn.commit()
+        for lesson_id, text, confidence, applied_count in rows:
+            if near_duplicate(shingles, lesson_shingles(column_codec.decode(text))):
+                return lesson_id, confidence, applied_count or 0
+        return None
+    
+    @tracer.traced("lesson.add")
+    async def add_lesson(self, category: str, lesson: str, confidence: float = 0.7, merge: bool = True) -> int:
+        """Add lesson with confidence scoring; a near-duplicate reinforces the existing lesson instead"""
+        async with self.lesson_lock:
+            match = self.similar_lesson(category, lesson) if merge else None
+            if match is not None:
+                lesson_id, current, applied_count = match
+                confidence = reinforce(current, confidence)
+                await storage.write(
+                    "UPDATE lessons SET confidence = ?, applied_count = ? WHERE id = ?",
+                    (confidence, applied_count + 1, lesson_id)
+                )
+                logger.info(f"📚 Lesson reinforced: [{category}] #{lesson_id} now {confidence:.2f} confidence")
+                event_bus.publish("lesson", {"id": lesson_id, "category": category, "confidence": confidence,
+                                             "applied_count": applied_count + 1, "merged": True})
+                return lesson_id
+            lesson_id = await storage.write_indexed(
+                "lessons",
+                "INSERT INTO lessons(ts,category,lesson,confidence) VALUES(?,?,?,?)",
+                (now_ts(), category, column_codec.encode(lesson), confidence)
+            )
         logger.info(f"📚 Lesson learned: [{category}] {lesson[:100]}...")
+        event_bus.publish("lesson", {"id": lesson_id, "category": category, "lesson": lesson, "confidence": confidence})
+        return lesson_id
     
-    def add_knowledge(self, topic: str, content: str, source: str, reliability: float = 0.5):
+    async def add_knowledge(self, topic: str, content: str, source: str, reliability: float = 0.5) -> int:
         """Add to knowledge base"""
-        cur.execute(
+        return await storage.write(
             "INSERT INTO knowledge_base(ts,topic,content,source,reliability) VALUES(?,?,?,?,?)",
-            (datetime.utcnow().isoformat(), topic, content, source, reliability)
+            (now_ts(), topic, content, source, reliability)
+        )
+
+    async def resolve_incident(self, incident_id: int, resolution: str) -> bool:
+        """Mark an incident resolved; False when no such incident exists"""
+        updated = await storage.write(
+            "UPDATE incidents SET resolved = TRUE, resolution = ? WHERE id = ?", (resolution, incident_id)
         )
-        conn.commit()
+        if updated:
+            event_bus.publish("incident_resolved", {"id": incident_id, "resolution": resolution})
+        return updated > 0
     
-    def analyze_pattern(self, incidents: List[Dict]) -> Dict[str, Any]:
+    def analyze_pattern(self) -> Dict[str, Any]:
         """Analyze incident patterns for proactive fixes"""
-        patterns = {}
-        for incident in incidents:
-            key = f"{incident['source']}_{incident['kind']}"
-            if key not in patterns:
-                patterns[key] = {"count": 0, "severity": [], "recent": False}
-            patterns[key]["count"] += 1
-            patterns[key]["severity"].append(incident.get("severity", "medium"))
-            
-            # Check if recent (last 24 hours)
-            try:
-                incident_time = datetime.fromisoformat(incident["ts"])
-                if (datetime.utcnow() - incident_time).total_seconds() < 86400:
-                    patterns[key]["recent"] = True
-            except:
-                pass
-        
-        return patterns
+        return self.patterns.snapshot()
     
-    async def llm_analyze(self, prompt: str, mode: str = "analyze") -> str:
+    @tracer.traced("llm.analyze")
+    async def llm_analyze(self, prompt: str, mode: str = "analyze", timeout: Optional[float] = None, use_cache: bool = True) -> str:
         """Enhanced LLM analysis with different modes"""
+        tracer.annotate(mode=mode)
         if not GEMINI_API_KEY:
             return "AI analysis unavailable - Gemini API key not configured. Set GEMINI_API_KEY in .env file."
         
+        system_prompt = LLM_SYSTEM_PROMPTS.get(mode, LLM_SYSTEM_PROMPTS["analyze"])
+        full_prompt = f"{system_prompt}\n\nContext: {prompt}"
+        deadline = timeout or LLM_TIMEOUT
+        
+        async def generate() -> str:
+            if not llm_breaker.allow():
+                LLM_REQUESTS.inc(mode=mode, outcome="circuit_open")
+                raise CircuitOpenError()
+            span = tracer.start("llm.generate", mode=mode, prompt_chars=len(full_prompt))
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                text = await llm_client.generate(full_prompt, deadline)
+                outcome = "ok"
+                llm_breaker.record_success()
+                return (text or "AI analysis completed").strip()[:2000]
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                llm_breaker.record_failure()
+                raise
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                llm_breaker.release()
+                raise
+            except Exception:
+                llm_breaker.record_failure()
+                raise
+            finally:
+                tracer.finish(span, error=None if outcome == "ok" else outcome)
+                LLM_REQUESTS.inc(mode=mode, outcome=outcome)
+                LLM_DURATION.observe(time.perf_counter() - started, mode=mode)
+        
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=GEMINI_API_KEY)
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            
-            if mode == "analyze":
-                system_prompt = """You are a senior software engineer analyzing NexteraEstate production issues. 
-                Provide clear, actionable analysis in plain language. Focus on:
-                1. Root cause
-                2. Immediate fix
-                3. Prevention strategy
-                Be direct and specific. Keep under 200 words."""
-            elif mode == "fix":
-                system_prompt = """You are an expert DevOps engineer providing fix instructions for NexteraEstate.
-                Give step-by-step solutions in plain language. Include:
-                1. Exact commands or code changes
-                2. Expected results
-                3. How to verify the fix worked
-                Be precise and actionable. Keep under 200 words."""
-            elif mode == "learn":
-                system_prompt = """You are a tech lead extracting lessons from NexteraEstate incidents.
-                Identify patterns and create rules to prevent future issues. Focus on:
-                1. What pattern led to this issue
-                2. How to detect it early
-                3. Automated prevention measures
-                Be strategic and forward-thinking. Keep under 200 words."""
-            
-            full_prompt = f"{system_prompt}\n\nContext: {prompt}"
-            response = model.generate_content(full_prompt)
-            return (response.text or "AI analysis completed").strip()[:2000]
+            if not use_cache:
+                return await generate()
+            return await prompt_cache.get_or_compute(prompt_cache.make_key(prompt, mode), mode, generate)
+        except CircuitOpenError:
+            return f"AI analysis paused after repeated failures - retrying in {llm_breaker.retry_in():.0f}s."
+        except asyncio.TimeoutError:
+            logger.error(f"LLM analysis timed out after {deadline}s")
+            return f"AI analysis timed out after {deadline:.0f}s. Try again shortly."
         except Exception as e:
             logger.error(f"LLM analysis failed: {e}")
             return f"AI analysis failed: {str(e)}. Check GEMINI_API_KEY configuration."
     
+    async def llm_stream(self, prompt: str, mode: str = "analyze", timeout: Optional[float] = None):
+        """Streaming llm_analyze: yields the answer as it is generated, failures as a final chunk"""
+        if not GEMINI_API_KEY:
+            yield "AI analysis unavailable - Gemini API key not configured. Set GEMINI_API_KEY in .env file."
+            return
+        
+        key = prompt_cache.make_key(prompt, mode)
+        cached = prompt_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        if not llm_breaker.allow():
+            LLM_REQUESTS.inc(mode=mode, outcome="circuit_open")
+            yield f"AI analysis paused after repeated failures - retrying in {llm_breaker.retry_in():.0f}s."
+            return
+        
+        system_prompt = LLM_SYSTEM_PROMPTS.get(mode, LLM_SYSTEM_PROMPTS["analyze"])
+        full_prompt = f"{system_prompt}\n\nContext: {prompt}"
+        deadline = timeout or LLM_TIMEOUT
+        span = tracer.start("llm.stream", mode=mode, prompt_chars=len(full_prompt))
+        started = time.perf_counter()
+        outcome = "error"
+        parts = []
+        try:
+            async for text in llm_client.stream(full_prompt, deadline):
+                parts.append(text)
+                yield text
+            outcome = "ok"
+            llm_breaker.record_success()
+            prompt_cache.put(key, mode, "".join(parts).strip() or "AI analysis completed")
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            llm_breaker.record_failure()
+            logger.error(f"LLM stream timed out after {deadline}s")
+            yield ("\n\n" if parts else "") + f"AI analysis timed out after {deadline:.0f}s. Try again shortly."
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            llm_breaker.release()
+            raise
+        except Exception as e:
+            llm_breaker.record_failure()
+            logger.error(f"LLM stream failed: {e}")
+            yield ("\n\n" if parts else "") + f"AI analysis failed: {str(e)}. Check GEMINI_API_KEY configuration."
+        finally:
+            tracer.finish(span, error=None if outcome == "ok" else outcome)
+            LLM_REQUESTS.inc(mode=mode, outcome=outcome)
+            LLM_DURATION.observe(time.perf_counter() - started, mode=mode)
+    
+    @tracer.traced("incident.auto_fix")
     async def auto_fix_attempt(self, incident_id: int, incident: Dict[str, Any]) -> Dict[str, Any]:
         """Attempt automatic fix based on learned patterns"""
         if not self.auto_fix_enabled:
             return {"attempted": False, "reason": "Auto-fix disabled"}
+        if not llm_breaker.available():
+            return {"attempted": False, "reason": f"AI analysis paused - retrying in {llm_breaker.retry_in():.0f}s"}
         
         fix_suggestions = await self.llm_analyze(
             f"NexteraEstate Incident: {incident['message']} - Data: {json.dumps(incident.get('data', {}))}", 
@@ -204,32 +2079,137 @@ class TechDirector:
         
         # For now, log the suggestion - in a more advanced version, 
         # this could execute safe automated fixes
-        cur.execute(
+        await storage.write_indexed(
+            "fixes",
             "INSERT INTO fixes(ts,incident_id,fix_type,fix_action,success,result) VALUES(?,?,?,?,?,?)",
-            (datetime.utcnow().isoformat(), incident_id, "suggestion", fix_suggestions, False, "Logged for manual review")
+            (now_ts(), incident_id, "suggestion", column_codec.encode(fix_suggestions), False, "Logged for manual review")
         )
-        conn.commit()
         
         logger.info(f"🔧 Auto-fix suggestion for incident {incident_id}: {fix_suggestions[:100]}...")
         
         return {
-            "attempted": True,
-            "type": "suggestion", 
-            "action": fix_suggestions,
-            "status": "requires_manual_review"
+            "attempted": True,
+            "type": "suggestion", 
+            "action": fix_suggestions,
+            "status": "requires_manual_review"
+        }
+
+# Initialize Tech Director
+tech_director = TechDirector()
+
+class AuthGuard:
+    """Per-IP token buckets for failed admin auth, and windowed failure counters.
+
+    Each failure spends a token; an IP with an empty bucket is answered 429 before its
+    token is even checked. Failures are counted in memory and written as one summary
+    incident per reason per window, so hostile traffic costs no per-request disk writes.
+    """
+
+    def __init__(self, burst: float = AUTH_FAILURE_BURST, rate_per_minute: float = AUTH_FAILURE_RATE,
+                 window: float = AUTH_SUMMARY_WINDOW, max_ips: int = AUTH_TRACKED_IPS):
+        self.burst = burst
+        self.rate = rate_per_minute / 60
+        self.window = window
+        self.max_ips = max_ips
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.window_started = time.time()
+        self.open_windows: Dict[str, str] = {}
+        self.summaries = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def _bucket(self, ip: str) -> list:
+        now = time.monotonic()
+        bucket = self.buckets.get(ip)
+        if bucket is None:
+            bucket = self.buckets[ip] = [self.burst, now]
+            if len(self.buckets) > self.max_ips:
+                self.buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self.buckets.move_to_end(ip)
+        return bucket
+
+    def retry_after(self, ip: str) -> Optional[int]:
+        """Seconds until `ip` may try again, or None when it still has budget"""
+        if ip not in self.buckets:
+            return None
+        tokens = self._bucket(ip)[0]
+        return None if tokens >= 1 else max(1, math.ceil((1 - tokens) / self.rate))
+
+    def note(self, reason: str, ip: str, spend: bool = False):
+        AUTH_FAILURES.inc(reason=reason)
+        per_ip = self.counts.setdefault(reason, {})
+        per_ip[ip] = per_ip.get(ip, 0) + 1
+        if spend:
+            self._bucket(ip)[0] -= 1
+
+    async def flush(self):
+        """Write one incident per reason for the window just ended, closing the previous window's"""
+        counts, self.counts = self.counts, {}
+        started, self.window_started = self.window_started, time.time()
+        await self.close_windows()
+        for reason, per_ip in counts.items():
+            total = sum(per_ip.values())
+            top = sorted(per_ip.items(), key=lambda item: item[1], reverse=True)[:20]
+            # A per-window key keeps each window its own row instead of folding into the last one
+            key = f"{reason}:{os.getpid()}:{int(started)}"
+            await tech_director.record_incident(
+                "auth", reason, AUTH_SEVERITY.get(reason, "medium"),
+                f"{total} {reason} admin request(s) from {len(per_ip)} IP(s) in the last {round(self.window_started - started)}s",
+                {"total": total, "distinct_ips": len(per_ip), "top_ips": dict(top),
+                 "window_start": ts_to_iso(int(started)), "window_end": ts_to_iso(int(self.window_started))},
+                key=key
+            )
+            self.open_windows[reason] = key
+            self.summaries += 1
+
+    async def close_windows(self):
+        windows, self.open_windows = self.open_windows, {}
+        for reason, key in windows.items():
+            await tech_director.resolve_open("auth", reason, "Summary window closed", key=key)
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.window)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Auth summary flush failed: {e}")
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        await self.flush()
+        await self.close_windows()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_ips": len(self.buckets),
+            "throttled_ips": sum(1 for tokens, _ in self.buckets.values() if tokens < 1),
+            "pending": {reason: sum(per_ip.values()) for reason, per_ip in self.counts.items()},
+            "summaries": self.summaries,
         }
 
-# Initialize Tech Director
-tech_director = TechDirector()
+AUTH_SEVERITY = {"unauthorized": "high", "throttled": "high", "forbidden": "medium"}
+auth_guard = AuthGuard()
 
-def require_admin(request: Request):
-    """Enhanced admin authentication"""
-    auth = request.headers.get("authorization", "")
-    token = auth.replace("Bearer ", "")
+def check_admin(request: Request, authenticated: bool):
+    """Throttle, then reject failed auth, then flag non-allowlisted IPs"""
     ip = request.client.host if request.client else "unknown"
+    retry_after = auth_guard.retry_after(ip)
+    if retry_after is not None:
+        auth_guard.note("throttled", ip)
+        raise HTTPException(status_code=429, detail="Too many failed attempts", headers={"Retry-After": str(retry_after)})
     
-    if token != ADMIN_TOKEN:
-        tech_director.save_incident("auth", "unauthorized", "high", f"Invalid token from {ip}", {"ip": ip, "token_prefix": token[:8]})
+    if not authenticated:
+        auth_guard.note("unauthorized", ip, spend=True)
         raise HTTPException(status_code=401, detail="Unauthorized access attempt logged")
     
     # More permissive IP checking for local development
@@ -237,62 +2217,492 @@ def require_admin(request: Request):
                  for allowed_ip in ALLOW_IPS)
     
     if not allowed:
-        tech_director.save_incident("auth", "forbidden", "medium", f"IP not in allowlist: {ip}", {"ip": ip})
+        auth_guard.note("forbidden", ip)
         # Don't block for now, just log
         logger.warning(f"⚠️ Access from non-whitelisted IP: {ip}")
     
     return True
 
-async def comprehensive_health_check() -> Dict[str, Any]:
-    """Enhanced health checking with detailed analysis"""
-    results = {"timestamp": datetime.utcnow().isoformat(), "overall_status": "unknown"}
+def sign_event_ticket(expires: int) -> str:
+    return hmac.new(ADMIN_TOKEN.encode(), f"events|{expires}".encode(), hashlib.sha256).hexdigest()
+
+def issue_event_ticket() -> Dict[str, Any]:
+    """Short-lived credential for opening /agent/events; signed, so any worker can check it"""
+    expires = int(time.time() + EVENT_TICKET_TTL)
+    return {"ticket": f"{expires}.{sign_event_ticket(expires)}", "expires_in": EVENT_TICKET_TTL}
+
+def valid_event_ticket(ticket: str) -> bool:
+    expires, _, signature = ticket.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature.encode(), sign_event_ticket(int(expires)).encode())
+
+async def require_admin(request: Request):
+    """Enhanced admin authentication"""
+    auth = request.headers.get("authorization", "")
+    return check_admin(request, hmac.compare_digest(auth.replace("Bearer ", "").encode(), ADMIN_TOKEN.encode()))
+
+async def require_event_stream(request: Request):
+    """Admin auth for /agent/events: Bearer token, or a ?ticket= from /agent/events/ticket.
+
+    Browsers' EventSource cannot set headers; a ticket keeps the admin token itself out
+    of URLs, access logs and browser history.
+    """
+    if request.headers.get("authorization"):
+        return await require_admin(request)
+    return check_admin(request, valid_event_ticket(request.query_params.get("ticket", "")))
+
+# Shared outbound connection pool (bound to the server event loop)
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """App-scoped keep-alive client so probes reuse TCP/TLS connections between checks"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http2 = PROBE_HTTP2 and importlib.util.find_spec("h2") is not None
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(PROBE_READ_TIMEOUT, connect=PROBE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=PROBE_MAX_CONNECTIONS,
+                max_keepalive_connections=PROBE_MAX_CONNECTIONS,
+                keepalive_expiry=120
+            ),
+            http2=http2
+        )
+        logger.info(f"🔌 Probe connection pool ready (http2={http2})")
+    return http_client
+
+class ProbeTarget(BaseModel):
+    name: str
+    url: str
+    method: str = "GET"
+    expect_status: List[int] = [200]
+    body_contains: Optional[str] = None
+    body_regex: Optional[str] = None
+    interval: float = PROBE_DEFAULT_INTERVAL
+    timeout: float = PROBE_READ_TIMEOUT
+    follow_redirects: bool = False
+    severity: str = "medium"
+    enabled: bool = True
+    core: bool = False
+
+    def resolved_url(self) -> str:
+        return self.url.replace("{SITE_URL}", SITE_URL).replace("{API_URL}", API_URL)
+
+# Core targets feed comprehensive_health_check; everything else runs on the probe engine's own clock
+CORE_PROBES = [
+    ProbeTarget(name="site_home", url="{SITE_URL}", follow_redirects=True, severity="critical", core=True),
+    ProbeTarget(name="site_auth", url="{SITE_URL}/api/auth/session", expect_status=[200, 401], core=True),
+    ProbeTarget(name="api_health", url="{API_URL}/api/health", severity="critical", core=True),
+]
+
+PROBE_COLUMNS = ["name", "url", "method", "expect_status", "body_contains", "body_regex", "interval", "timeout", "severity", "enabled"]
+
+def load_probe_targets() -> Dict[str, ProbeTarget]:
+    """Merge built-in, probe_targets table and PROBES_FILE definitions (later sources win by name)"""
+    targets = {target.name: target for target in CORE_PROBES}
+    definitions = []
     
-    async with httpx.AsyncClient(timeout=30) as client:
-        # Site health check
-        site_results = {}
+    for row in storage.query(f"SELECT {', '.join(PROBE_COLUMNS)} FROM probe_targets"):
+        entry = {column: value for column, value in zip(PROBE_COLUMNS, row) if value is not None}
+        if "expect_status" in entry:
+            entry["expect_status"] = json.loads(entry["expect_status"])
+        definitions.append(entry)
+    
+    if os.path.exists(PROBES_FILE):
         try:
-            # Main site
-            home_response = await client.get(SITE_URL, follow_redirects=True)
-            site_results["home"] = {
-                "ok": home_response.status_code == 200,
-                "status_code": home_response.status_code,
-                "url": SITE_URL
-            }
-            
-            # Authentication endpoints
-            try:
-                auth_response = await client.get(f"{SITE_URL}/api/auth/session")
-                site_results["auth"] = {"ok": auth_response.status_code in [200, 401]}
-            except:
-                site_results["auth"] = {"ok": False, "error": "Auth endpoint unreachable"}
-                
+            with open(PROBES_FILE) as f:
+                definitions.extend(json.load(f))
+        except Exception as e:
+            logger.error(f"❌ Failed to read probe registry {PROBES_FILE}: {e}")
+    
+    for entry in definitions:
+        try:
+            target = ProbeTarget(**entry)
         except Exception as e:
-            site_results["error"] = str(e)
-            site_results["home"] = {"ok": False, "error": str(e)}
+            logger.error(f"❌ Invalid probe definition {entry.get('name', '?')}: {e}")
+            continue
+        if target.name in targets and targets[target.name].core:
+            target.core = True
+        targets[target.name] = target
+    
+    return targets
+
+def probe_timings(marks: Dict[str, float], started: float) -> Dict[str, Optional[float]]:
+    """Phase durations from httpcore trace events (last hop when redirects are followed).
+
+    Name resolution happens inside connect_tcp, so connect_ms includes DNS. Phases that did
+    not happen - connect and TLS on a reused keep-alive connection - are None.
+    """
+    def span(start: str, end: str) -> Optional[float]:
+        if start in marks and end in marks:
+            return round((marks[end] - marks[start]) * 1000, 1)
+        return None
+    
+    ttfb = marks.get("receive_response_headers.complete")
+    return {
+        "connect_ms": span("connect_tcp.started", "connect_tcp.complete"),
+        "tls_ms": span("start_tls.started", "start_tls.complete"),
+        "ttfb_ms": round((ttfb - started) * 1000, 1) if ttfb else None,
+    }
+
+# Rollup tier -> bucket width; retention per tier (raw samples included) in seconds
+METRIC_TIERS = {"1m": 60, "1h": 3600, "1d": 86400}
+METRIC_RETENTION = {"raw": METRICS_RAW_RETENTION_DAYS * 86400, "1m": 7 * 86400, "1h": 90 * 86400, "1d": 730 * 86400}
+
+class LatencyRecorder:
+    """Buffers probe samples and flushes them as raw rows plus 1m/1h/1d rollups"""
+
+    ROLLUP_METRICS = ("connect_ms", "tls_ms", "ttfb_ms", "total_ms", "ok")
+
+    def __init__(self, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.buffer: List[tuple] = []
+        self.last_prune = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def record_probe(self, target: str, result: Dict[str, Any]):
+        ts = now_ts()
+        samples = {"total_ms": result["response_ms"], "ok": 1.0 if result["ok"] else 0.0, "status_code": result.get("status_code")}
+        samples.update(result.get("timings") or {})
+        for metric, value in samples.items():
+            if value is not None:
+                self.buffer.append((ts, target, metric, float(value)))
+
+    async def flush(self):
+        samples, self.buffer = self.buffer, []
+        if not samples:
+            return
         
-        results["site"] = site_results
+        rollups: Dict[tuple, List[float]] = {}
+        for ts, target, metric, value in samples:
+            if metric not in self.ROLLUP_METRICS:
+                continue
+            for tier, width in METRIC_TIERS.items():
+                key = (tier, ts - ts % width, target, metric)
+                agg = rollups.get(key)
+                if agg is None:
+                    rollups[key] = [1, value, value, value]
+                else:
+                    agg[0] += 1
+                    agg[1] += value
+                    agg[2] = min(agg[2], value)
+                    agg[3] = max(agg[3], value)
         
-        # API health check
-        api_results = {}
-        try:
-            health_response = await client.get(f"{API_URL}/api/health")
-            api_results["health"] = {
-                "ok": health_response.status_code == 200,
-                "status_code": health_response.status_code,
-                "url": f"{API_URL}/api/health"
+        writes = [
+            storage.submit_many(
+                "INSERT INTO performance_metrics(ts,metric_name,metric_value,context) VALUES(?,?,?,?)",
+                [(ts, f"probe.{metric}", value, target) for ts, target, metric, value in samples]
+            ),
+            storage.submit_many(
+                """INSERT INTO metric_rollups(tier,bucket,target,metric,count,sum,min,max) VALUES(?,?,?,?,?,?,?,?)
+                ON CONFLICT(tier,target,metric,bucket) DO UPDATE SET
+                    count = count + excluded.count, sum = sum + excluded.sum,
+                    min = MIN(min, excluded.min), max = MAX(max, excluded.max)""",
+                [key + tuple(agg) for key, agg in rollups.items()]
+            ),
+        ]
+        await asyncio.gather(*(asyncio.wrap_future(write) for write in writes))
+
+    async def prune(self):
+        """Drop raw samples and rollup buckets that are past their tier's retention"""
+        now = now_ts()
+        await storage.write("DELETE FROM performance_metrics WHERE ts < ?", (now - METRIC_RETENTION["raw"],))
+        for tier in METRIC_TIERS:
+            await storage.write("DELETE FROM metric_rollups WHERE tier = ? AND bucket < ?", (tier, now - METRIC_RETENTION[tier]))
+        self.last_prune = time.monotonic()
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if leader_elector.is_leader and time.monotonic() - self.last_prune > 3600:
+                    await self.prune()
+            except Exception as e:
+                logger.error(f"❌ Latency metrics flush failed: {e}")
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        await self.flush()
+
+    def series(self, target: str, metric: str, tier: str, since: int, until: int) -> List[Dict[str, Any]]:
+        if tier == "raw":
+            rows = storage.query(
+                "SELECT ts, metric_value FROM performance_metrics WHERE context = ? AND metric_name = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (target, f"probe.{metric}", since, until)
+            )
+            return [{"ts": ts_to_iso(ts), "value": value} for ts, value in rows]
+        rows = storage.query(
+            "SELECT bucket, count, sum, min, max FROM metric_rollups WHERE tier = ? AND target = ? AND metric = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+            (tier, target, metric, since - since % METRIC_TIERS[tier], until)
+        )
+        return [
+            {"ts": ts_to_iso(bucket), "count": count, "avg": round(total / count, 2), "min": low, "max": high}
+            for bucket, count, total, low, high in rows
+        ]
+
+latency_recorder = LatencyRecorder()
+
+class ProbeEngine:
+    """Runs registry targets on adaptive per-target intervals with bounded concurrency.
+
+    A failing target is re-checked at `PROBE_DEGRADED_FACTOR` of its interval, a target that
+    has been healthy for `PROBE_STABLE_AFTER` probes backs off towards `PROBE_BACKOFF_FACTOR`
+    times its interval, and every target sits behind a circuit breaker so a dead endpoint
+    costs one fast failure instead of a full timeout per check.
+    """
+
+    def __init__(self, concurrency: int = PROBE_CONCURRENCY):
+        self.targets: Dict[str, ProbeTarget] = {target.name: target for target in CORE_PROBES}
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.next_due: Dict[str, float] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.streaks: Dict[str, int] = {}
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def load(self):
+        self.targets = load_probe_targets()
+        now = time.monotonic()
+        for name, target in self.targets.items():
+            if name not in self.next_due:
+                # Spread first runs so hundreds of targets don't fire in the same instant
+                self.next_due[name] = now + random.uniform(0, min(target.interval, 30))
+        for name in list(self.next_due):
+            if name not in self.targets:
+                self.next_due.pop(name)
+                self.results.pop(name, None)
+                self.streaks.pop(name, None)
+                self.breakers.pop(name, None)
+        self.wakeup.set()
+        logger.info(f"🎯 Probe registry loaded: {len(self.targets)} targets")
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(f"probe:{name}")
+        return breaker
+
+    def next_interval(self, target: ProbeTarget) -> float:
+        """Seconds until the target's next probe, from its recent outcomes and breaker state"""
+        breaker = self.breaker(target.name)
+        result = self.results.get(target.name) or {}
+        if breaker.state == "open":
+            # Jitter only later, so the trial never lands inside the cooldown and short-circuits
+            return max(breaker.retry_in(), PROBE_MIN_INTERVAL) * random.uniform(1, 1 + PROBE_JITTER)
+        if result and not result.get("ok"):
+            interval = max(PROBE_MIN_INTERVAL, target.interval * PROBE_DEGRADED_FACTOR)
+        else:
+            # Each further run of PROBE_STABLE_AFTER successes adds one interval, up to the backoff cap
+            stable = max(0, self.streaks.get(target.name, 0) - PROBE_STABLE_AFTER)
+            interval = target.interval * max(1.0, min(PROBE_BACKOFF_FACTOR, 1 + stable / max(1, PROBE_STABLE_AFTER)))
+        return interval * random.uniform(1 - PROBE_JITTER, 1 + PROBE_JITTER)
+
+    @tracer.traced("probe")
+    async def probe(self, target: ProbeTarget) -> Dict[str, Any]:
+        """Probe one target; core targets skip the concurrency gate so health checks never queue"""
+        tracer.annotate(target=target.name)
+        breaker = self.breaker(target.name)
+        if not breaker.allow():
+            PROBES.inc(target=target.name, outcome="short_circuit")
+            tracer.annotate(ok=False, circuit_open=True)
+            # Repeat the last real failure so incidents keep the same error class (and fingerprint)
+            last = self.results.get(target.name) or {}
+            result = {
+                "ok": False, "url": target.resolved_url(), "checked_at": datetime.utcnow().isoformat(),
+                "error": last.get("error") or f"Circuit open after {breaker.failures} failures",
+                "circuit_open": True, "retry_in": round(breaker.retry_in(), 1), "response_ms": 0,
             }
-            
-            if health_response.status_code == 200:
-                try:
-                    health_data = health_response.json()
-                    api_results["features"] = health_data.get("features", {})
-                except:
-                    api_results["features"] = {}
+            if last.get("status_code") is not None:
+                result["status_code"] = last["status_code"]
+            return result
+        try:
+            if target.core:
+                result = await self._probe(target)
+            else:
+                async with self.semaphore:
+                    result = await self._probe(target)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        if result["ok"]:
+            breaker.record_success()
+            self.streaks[target.name] = self.streaks.get(target.name, 0) + 1
+        else:
+            breaker.record_failure()
+            self.streaks[target.name] = 0
+        await self._record(target, result)
+        latency_recorder.record_probe(target.name, result)
+        PROBES.inc(target=target.name, outcome="ok" if result["ok"] else "fail")
+        PROBE_DURATION.observe(result["response_ms"] / 1000, target=target.name)
+        tracer.annotate(ok=result["ok"], status_code=result.get("status_code"))
+        return result
+
+    async def _probe(self, target: ProbeTarget) -> Dict[str, Any]:
+        url = target.resolved_url()
+        result: Dict[str, Any] = {"ok": False, "url": url, "checked_at": datetime.utcnow().isoformat()}
+        marks: Dict[str, float] = {}
+        
+        async def trace(event: str, info: Dict[str, Any]):
+            marks[event.split(".", 1)[1]] = time.perf_counter()
+        
+        started = time.perf_counter()
+        try:
+            response = await get_http_client().request(
+                target.method, url,
+                follow_redirects=target.follow_redirects,
+                timeout=httpx.Timeout(target.timeout, connect=min(PROBE_CONNECT_TIMEOUT, target.timeout)),
+                extensions={"trace": trace}
+            )
+            result["status_code"] = response.status_code
+            result["ok"] = response.status_code in target.expect_status
+            if result["ok"] and target.body_contains is not None:
+                result["ok"] = target.body_contains in response.text
+            if result["ok"] and target.body_regex:
+                result["ok"] = re.search(target.body_regex, response.text) is not None
+            if not result["ok"] and response.status_code in target.expect_status:
+                result["error"] = "Response body did not match expectation"
+            result["response"] = response
         except Exception as e:
-            api_results["error"] = str(e)
-            api_results["health"] = {"ok": False, "error": str(e)}
+            result["error"] = str(e) or type(e).__name__
+        result["response_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        result["timings"] = probe_timings(marks, started)
+        return result
+
+    async def _record(self, target: ProbeTarget, result: Dict[str, Any]):
+        previous = self.results.get(target.name)
+        failures = 0 if result["ok"] else (previous or {}).get("consecutive_failures", 0) + 1
+        self.results[target.name] = {k: v for k, v in result.items() if k != "response"}
+        self.results[target.name]["consecutive_failures"] = failures
+        
+        # Core targets are handled by intelligent_incident_response; registry targets report state changes
+        if target.core:
+            return
+        if failures:
+            await tech_director.record_incident(
+                "probe", "down", target.severity,
+                f"Probe {target.name} failing: {result.get('error') or result.get('status_code')}",
+                {"target": target.name, **self.results[target.name]},
+                key=target.name
+            )
+        elif previous and not previous["ok"]:
+            logger.info(f"✅ Probe {target.name} recovered after {previous['consecutive_failures']} failures")
+            await tech_director.resolve_open("probe", "down", "Probe recovered", key=target.name)
+
+    async def run_forever(self):
+        while True:
+            now = time.monotonic()
+            scheduled = [t for t in self.targets.values() if t.enabled and not t.core]
+            for target in scheduled:
+                if self.next_due.get(target.name, 0) <= now and target.name not in self.inflight:
+                    # Provisional slot while the probe runs; replaced once its outcome is known
+                    self.next_due[target.name] = now + target.timeout + target.interval
+                    task = asyncio.create_task(self.probe(target))
+                    self.inflight[target.name] = task
+                    task.add_done_callback(lambda task, name=target.name: self._reschedule(name, task))
+            
+            pending = [self.next_due[t.name] for t in scheduled if t.name in self.next_due]
+            delay = max(0.05, min(pending) - time.monotonic()) if pending else 60
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _reschedule(self, name: str, task: asyncio.Task):
+        self.inflight.pop(name, None)
+        target = self.targets.get(name)
+        if target is None or task.cancelled():
+            return
+        self.next_due[name] = time.monotonic() + self.next_interval(target)
+        self.wakeup.set()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        tasks = [t for t in [self.task, *self.inflight.values()] if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def summary(self) -> Dict[str, Any]:
+        registry = [name for name, target in self.targets.items() if not target.core and target.enabled]
+        failing = [name for name in registry if not self.results.get(name, {}).get("ok", True)]
+        open_circuits = [name for name, breaker in self.breakers.items() if breaker.state != "closed"]
+        return {"total": len(registry), "checked": sum(1 for n in registry if n in self.results), "failing": failing,
+                "open_circuits": open_circuits}
+
+probe_engine = ProbeEngine()
+
+@tracer.traced("health.check")
+async def comprehensive_health_check() -> Dict[str, Any]:
+    """Enhanced health checking with detailed analysis"""
+    results = {"timestamp": datetime.utcnow().isoformat(), "overall_status": "unknown"}
+    started = time.perf_counter()
+    
+    # Fan out the core probes at once: the cycle takes as long as the slowest probe, not their sum
+    home, auth, health = await asyncio.gather(
+        *(probe_engine.probe(probe_engine.targets[name]) for name in ["site_home", "site_auth", "api_health"])
+    )
+    
+    # Site health check
+    site_results = {}
+    if "status_code" not in home:
+        site_results["error"] = home["error"]
+        site_results["home"] = {"ok": False, "error": home["error"]}
+    else:
+        site_results["home"] = {
+            "ok": home["ok"],
+            "status_code": home["status_code"],
+            "url": home["url"],
+            "response_ms": home["response_ms"]
+        }
+    
+    # Authentication endpoints
+    if "status_code" not in auth:
+        site_results["auth"] = {"ok": False, "error": "Auth endpoint unreachable"}
+    else:
+        site_results["auth"] = {"ok": auth["ok"], "response_ms": auth["response_ms"]}
+    
+    if home.get("circuit_open"):
+        site_results["home"]["circuit_open"] = True
+    results["site"] = site_results
+    
+    # API health check
+    api_results = {}
+    if "status_code" not in health:
+        api_results["error"] = health["error"]
+        api_results["health"] = {"ok": False, "error": health["error"]}
+    else:
+        api_results["health"] = {
+            "ok": health["ok"],
+            "status_code": health["status_code"],
+            "url": health["url"],
+            "response_ms": health["response_ms"]
+        }
         
-        results["api"] = api_results
+        if health["ok"]:
+            try:
+                health_data = health["response"].json()
+                api_results["features"] = health_data.get("features", {})
+            except:
+                api_results["features"] = {}
+    
+    if health.get("circuit_open"):
+        api_results["health"]["circuit_open"] = True
+    results["api"] = api_results
+    results["targets"] = probe_engine.summary()
     
     # Determine overall status
     site_ok = results["site"].get("home", {}).get("ok", False)
@@ -305,62 +2715,476 @@ async def comprehensive_health_check() -> Dict[str, Any]:
     else:
         results["overall_status"] = "down"
     
+    HEALTH_CHECKS.inc(status=results["overall_status"])
+    HEALTH_CHECK_DURATION.observe(time.perf_counter() - started)
     return results
 
+@tracer.traced("incident.response")
 async def intelligent_incident_response(health_results: Dict[str, Any]):
     """Analyze health results and respond intelligently"""
     incidents_created = []
+    incidents_ongoing = []
+    incidents_escalated = []
+    incidents_resolved = []
+    short_circuited = []
     
-    # Check for site issues
-    site = health_results.get("site", {})
-    if not site.get("home", {}).get("ok", True):
-        incident_id = tech_director.save_incident(
-            "site", "down", "critical",
-            "NexteraEstate frontend is not responding",
-            site
-        )
-        incidents_created.append(incident_id)
-        
-        # Attempt analysis and auto-fix
-        incident_data = {"id": incident_id, "source": "site", "kind": "down", "message": "Frontend is not responding", "data": site}
-        fix_result = await tech_director.auto_fix_attempt(incident_id, incident_data)
-    
-    # Check for API issues
-    api = health_results.get("api", {})
-    if not api.get("health", {}).get("ok", True):
-        incident_id = tech_director.save_incident(
-            "api", "down", "critical",
-            "NexteraEstate backend API is not responding",
-            api
-        )
-        incidents_created.append(incident_id)
-        
-        # Attempt analysis and auto-fix
-        incident_data = {"id": incident_id, "source": "api", "kind": "down", "message": "Backend API is not responding", "data": api}
-        fix_result = await tech_director.auto_fix_attempt(incident_id, incident_data)
+    checks = [
+        ("site", health_results.get("site", {}), "home", "NexteraEstate frontend is not responding", "Frontend is not responding"),
+        ("api", health_results.get("api", {}), "health", "NexteraEstate backend API is not responding", "Backend API is not responding"),
+    ]
+    for source, results, probe, message, summary in checks:
+        if not results.get(probe, {}).get("ok", True):
+            incident = await tech_director.record_incident(source, "down", "critical", message, results)
+            
+            # Only new or escalated incidents get fresh analysis; repeats just bump the counter
+            if incident["transition"] == "ongoing":
+                incidents_ongoing.append(incident["id"])
+                continue
+            if incident["transition"] == "opened":
+                incidents_created.append(incident["id"])
+            else:
+                incidents_escalated.append(incident["id"])
+            
+            # A short-circuited probe is a replay of the last failure, not new evidence
+            if results[probe].get("circuit_open"):
+                short_circuited.append(incident["id"])
+                continue
+            
+            # Attempt analysis and auto-fix
+            incident_data = {"id": incident["id"], "source": source, "kind": "down", "message": summary, "data": results}
+            fix_result = await tech_director.auto_fix_attempt(incident["id"], incident_data)
+        else:
+            resolved = await tech_director.resolve_open(source, "down", f"Recovered automatically at {datetime.utcnow().isoformat()}")
+            incidents_resolved.extend(resolved)
+            for incident in resolved:
+                if tech_director.learning_enabled and llm_breaker.available():
+                    insight = await tech_director.llm_analyze(
+                        f"NexteraEstate {source} outage recovered: down from {incident['opened']} to {incident['last_seen']} "
+                        f"across {incident['occurrences']} consecutive checks",
+                        mode="learn"
+                    )
+                    await tech_director.add_lesson("incident_resolution", insight, confidence=0.8)
     
     # Learn from patterns
-    if incidents_created and tech_director.learning_enabled:
-        recent_incidents = []
-        cur.execute("SELECT id, ts, source, kind, severity, message, data FROM incidents WHERE ts > datetime('now', '-1 day') ORDER BY ts DESC LIMIT 50")
-        for row in cur.fetchall():
-            recent_incidents.append({
-                "id": row[0], "ts": row[1], "source": row[2], "kind": row[3],
-                "severity": row[4], "message": row[5], "data": json.loads(row[6]) if row[6] else {}
-            })
-        
-        patterns = tech_director.analyze_pattern(recent_incidents)
+    fresh = [incident_id for incident_id in incidents_created if incident_id not in short_circuited]
+    if fresh and tech_director.learning_enabled and llm_breaker.available():
+        patterns = tech_director.analyze_pattern()
         
         # Generate insights
         for pattern, data in patterns.items():
-            if data["count"] > 2 and data["recent"]:
+            if data["count"] > 2 and data["recent"] and llm_breaker.available():
                 insight = await tech_director.llm_analyze(
                     f"Pattern detected in NexteraEstate: {pattern} occurred {data['count']} times recently",
                     mode="learn"
                 )
-                tech_director.add_lesson("pattern_analysis", insight, confidence=0.8)
+                await tech_director.add_lesson("pattern_analysis", insight, confidence=0.8)
+    
+    return {
+        "incidents_created": len(incidents_created),
+        "incidents_ongoing": len(incidents_ongoing),
+        "incidents_escalated": len(incidents_escalated),
+        "incidents_resolved": len(incidents_resolved),
+        "overall_status": health_results["overall_status"]
+    }
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key onto one in-flight task"""
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def running(self, key: str) -> bool:
+        return key in self.tasks
+
+    async def run(self, key: str, factory):
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self.tasks[key] = task
+            task.add_done_callback(lambda done: self.tasks.pop(key, None) if self.tasks.get(key) is done else None)
+        # A caller going away (client disconnect) must not cancel the work others are waiting on
+        return await asyncio.shield(task)
+
+flights = SingleFlight()
+
+def health_digest(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-component status flags, the unit health events report changes in"""
+    return {
+        "overall_status": results.get("overall_status"),
+        "site.home": results.get("site", {}).get("home", {}).get("ok"),
+        "site.auth": results.get("site", {}).get("auth", {}).get("ok"),
+        "api.health": results.get("api", {}).get("health", {}).get("ok"),
+        "targets.failing": sorted(results.get("targets", {}).get("failing", [])),
+    }
+
+class HealthSnapshot:
+    """Latest health check result, served immediately and revalidated in the background when stale"""
+
+    def __init__(self, max_age: float = HEALTH_SNAPSHOT_MAX_AGE):
+        self.max_age = max_age
+        self.results: Optional[Dict[str, Any]] = None
+        self.taken_at: Optional[float] = None
+        self.refreshes = 0
+        self.stale_served = 0
+        self.shared_adopted = 0
+        self.background: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Run a fresh check, joining one already in flight"""
+        return await flights.run("health", self._check)
+
+    async def _check(self) -> Dict[str, Any]:
+        results = await comprehensive_health_check()
+        previous = health_digest(self.results) if self.results else {}
+        self.results = results
+        self.taken_at = time.monotonic()
+        self.refreshes += 1
+        changed = {key: value for key, value in health_digest(results).items() if previous.get(key) != value}
+        if changed:
+            event_bus.publish("health", {
+                "overall_status": results["overall_status"],
+                "checked_at": results["timestamp"],
+                "changed": changed,
+            })
+        # Published so other workers serve this result instead of probing themselves
+        storage.submit(
+            "INSERT OR REPLACE INTO agent_state (key, value, updated_at) VALUES ('health_snapshot', ?, ?)",
+            (json.dumps(results, default=str), time.time())
+        )
+        return results
+
+    def adopt_shared(self) -> bool:
+        """Take the snapshot published by another worker when it is newer than ours"""
+        rows = storage.query("SELECT value, updated_at FROM agent_state WHERE key = 'health_snapshot'")
+        if not rows:
+            return False
+        value, updated_at = rows[0]
+        age = max(0.0, time.time() - updated_at)
+        if self.taken_at is not None and time.monotonic() - self.taken_at <= age:
+            return False
+        self.results = json.loads(value)
+        self.taken_at = time.monotonic() - age
+        self.shared_adopted += 1
+        return True
+
+    async def _revalidate(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"❌ Background health refresh failed: {e}")
+
+    async def get(self) -> Tuple[Dict[str, Any], float, bool]:
+        """Return (results, age in seconds, stale); only the very first call waits on the network"""
+        if not leader_elector.is_leader:
+            self.adopt_shared()
+        if self.results is None:
+            await self.refresh()
+        age = time.monotonic() - self.taken_at
+        stale = age > self.max_age
+        if stale:
+            self.stale_served += 1
+            if not flights.running("health"):
+                self.background = asyncio.create_task(self._revalidate())
+        return self.results, round(age, 2), stale
+
+health_snapshot = HealthSnapshot()
+
+async def run_check_cycle() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Fresh health check plus incident response, shared by the scheduler and /agent/check"""
+    @tracer.traced("check.cycle")
+    async def cycle():
+        health_results = await health_snapshot.refresh()
+        return health_results, await intelligent_incident_response(health_results)
+    return await flights.run("check", cycle)
+
+@tracer.traced("monitor.job")
+async def autonomous_monitoring_job():
+    """Autonomous monitoring job that runs every 5 minutes"""
+    logger.info("🤖 Running autonomous monitoring check...")
+    health_results, response_results = await run_check_cycle()
     
-    return {"incidents_created": len(incidents_created), "overall_status": health_results["overall_status"]}
+    # Log summary
+    status = health_results["overall_status"]
+    incidents = response_results["incidents_created"]
+    if incidents > 0:
+        logger.warning(f"⚠️ Monitoring detected {incidents} new incidents - platform status: {status}")
+    else:
+        logger.info(f"✅ Monitoring complete - platform status: {status}")
+
+class MonitorScheduler:
+    """Runs a job on the server's own event loop at a fixed cadence.
+
+    Runs never overlap; each wait gets up to `jitter` seconds of random delay without
+    drifting the schedule. When a run overruns its slot, `missed_runs="skip"` resumes at
+    the next future slot and `"run_once"` starts one catch-up run immediately. An optional
+    `cadence` callable overrides the interval before each slot, e.g. to check more often
+    while the platform is degraded.
+    """
+
+    def __init__(self, job, interval: float = MONITOR_INTERVAL, initial_delay: float = MONITOR_INITIAL_DELAY,
+                 jitter: float = MONITOR_JITTER, missed_runs: str = MONITOR_MISSED_RUNS, cadence=None):
+        self.job = job
+        self.interval = interval
+        self.base_interval = interval
+        self.cadence = cadence
+        self.initial_delay = initial_delay
+        self.jitter = jitter
+        self.missed_runs = missed_runs
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.current: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.overlaps_skipped = 0
+        self.slots_missed = 0
+        self.last_started: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.next_run: Optional[str] = None
+
+    async def run_once(self) -> bool:
+        """Run the job now unless a run is already in progress"""
+        if self.lock.locked():
+            self.overlaps_skipped += 1
+            logger.warning("⏭️ Monitoring cycle still running - skipping overlapping run")
+            return False
+        async with self.lock:
+            self.last_started = datetime.utcnow().isoformat()
+            started = time.monotonic()
+            self.current = asyncio.create_task(self.job())
+            try:
+                # Shielded so cancelling the scheduler leaves the cycle to stop()'s grace period
+                await asyncio.shield(self.current)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"❌ Autonomous monitoring failed: {e}")
+            finally:
+                self.current = None
+                self.runs += 1
+                self.last_duration = round(time.monotonic() - started, 2)
+        return True
+
+    async def run_forever(self):
+        next_slot = time.monotonic() + self.initial_delay
+        while True:
+            delay = max(0.0, next_slot - time.monotonic()) + random.uniform(0, self.jitter)
+            self.next_run = (datetime.utcnow() + timedelta(seconds=delay)).isoformat()
+            await asyncio.sleep(delay)
+            await self.run_once()
+            
+            if self.cadence:
+                interval = self.cadence()
+                if interval != self.interval:
+                    logger.info(f"⏰ Monitoring cadence now every {interval:g}s")
+                    self.interval = interval
+            next_slot += self.interval
+            now = time.monotonic()
+            if next_slot <= now:
+                missed = int((now - next_slot) // self.interval) + 1
+                self.slots_missed += missed
+                logger.warning(f"⏱️ Monitoring cycle overran {missed} slot(s) - policy: {self.missed_runs}")
+                if self.missed_runs == "run_once":
+                    next_slot = now
+                else:
+                    next_slot += missed * self.interval
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run_forever())
+            logger.info(f"⏰ Autonomous monitoring scheduled - checks every {self.interval / 60:g} minutes")
+
+    async def stop(self, grace: float = MONITOR_SHUTDOWN_GRACE):
+        """Stop scheduling, give an in-flight cycle `grace` seconds to finish, then cancel it"""
+        current = self.current
+        if self.task:
+            self.task.cancel()
+        if current and not current.done():
+            done, _ = await asyncio.wait({current}, timeout=grace)
+            if not done:
+                logger.warning("🛑 Cancelling monitoring cycle still running at shutdown")
+                current.cancel()
+        await asyncio.gather(*(t for t in [self.task, current] if t), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "base_interval_seconds": self.base_interval,
+            "running": self.lock.locked(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "overlaps_skipped": self.overlaps_skipped,
+            "slots_missed": self.slots_missed,
+            "last_started": self.last_started,
+            "last_duration_seconds": self.last_duration,
+            "next_run": self.next_run,
+        }
+
+def monitor_cadence() -> float:
+    """Check at MONITOR_DEGRADED_INTERVAL while the last snapshot is anything but healthy"""
+    results = health_snapshot.results
+    if results and results.get("overall_status") != "healthy":
+        return min(MONITOR_DEGRADED_INTERVAL, MONITOR_INTERVAL)
+    return MONITOR_INTERVAL
+
+monitor_scheduler = MonitorScheduler(autonomous_monitoring_job, cadence=monitor_cadence)
+
+class LeaderElector:
+    """SQLite lease that lets exactly one worker process run the background monitoring.
+
+    Every worker heartbeats the same lease row: the holder renews it, everyone else only
+    takes it over once it has expired. A holder that cannot renew before its own lease
+    would expire steps down, so two workers never monitor at once for longer than one
+    heartbeat. Followers keep serving requests and periodically resync derived state.
+    """
+
+    def __init__(self, name: str = "monitor", ttl: float = LEADER_LEASE_TTL, heartbeat: float = LEADER_HEARTBEAT,
+                 on_elected=None, on_demoted=None, on_follow=None, follow_interval: float = FOLLOWER_SYNC_INTERVAL):
+        self.name = name
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.on_follow = on_follow
+        self.follow_interval = follow_interval
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.renewed_at: Optional[float] = None
+        self.last_follow = time.monotonic()
+        self.elections = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def try_acquire(self) -> bool:
+        """Take or renew the lease; True when this worker holds it afterwards"""
+        now = time.time()
+        await storage.write(
+            """INSERT INTO leases (name, holder, acquired_at, expires_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET
+                   acquired_at = CASE WHEN leases.holder = excluded.holder THEN leases.acquired_at ELSE excluded.acquired_at END,
+                   holder = excluded.holder,
+                   expires_at = excluded.expires_at
+               WHERE leases.holder = excluded.holder OR leases.expires_at < ?""",
+            (self.name, self.holder, now, now + self.ttl, now)
+        )
+        # The writer reports lastrowid for upserts, so read back who holds the lease
+        rows = storage.query("SELECT holder FROM leases WHERE name = ?", (self.name,))
+        return bool(rows) and rows[0][0] == self.holder
+
+    async def release(self):
+        await storage.write("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+
+    async def _elected(self):
+        self.is_leader = True
+        self.elections += 1
+        logger.info(f"👑 Worker {self.holder} acquired the {self.name} lease")
+        if self.on_elected:
+            await self.on_elected(self.elections == 1)
+
+    async def _demoted(self):
+        self.is_leader = False
+        logger.warning(f"🪑 Worker {self.holder} gave up the {self.name} lease")
+        if self.on_demoted:
+            await self.on_demoted()
+
+    async def tick(self):
+        try:
+            held = await self.try_acquire()
+            if held:
+                self.renewed_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"❌ Lease heartbeat failed: {e}")
+            # Keep leading only while the last successful renewal still covers us
+            held = self.is_leader and self.renewed_at is not None and time.monotonic() - self.renewed_at < self.ttl - self.heartbeat
+        if held and not self.is_leader:
+            await self._elected()
+        elif not held and self.is_leader:
+            await self._demoted()
+        if not self.is_leader and self.on_follow and time.monotonic() - self.last_follow >= self.follow_interval:
+            self.last_follow = time.monotonic()
+            try:
+                await self.on_follow()
+            except Exception as e:
+                logger.error(f"❌ Follower resync failed: {e}")
+
+    async def run_forever(self):
+        while True:
+            await self.tick()
+            await asyncio.sleep(self.heartbeat)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.is_leader:
+            await self._demoted()
+            try:
+                await self.release()
+            except Exception as e:
+                logger.error(f"❌ Lease release failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lease = storage.query("SELECT holder, acquired_at, expires_at FROM leases WHERE name = ?", (self.name,))
+        holder, acquired_at, expires_at = lease[0] if lease else (None, None, None)
+        return {
+            "worker": self.holder,
+            "is_leader": self.is_leader,
+            "elections": self.elections,
+            "lease_holder": holder,
+            "lease_acquired_at": ts_to_iso(int(acquired_at)) if acquired_at else None,
+            "lease_expires_in_seconds": round(expires_at - time.time(), 1) if expires_at else None,
+        }
+
+async def start_monitoring(first_election: bool):
+    """Leader-only background work"""
+    probe_engine.start()
+    monitor_scheduler.start()
+    if first_election:
+        await tech_director.add_lesson(
+            "startup", 
+            f"Tech Director deployed at {datetime.utcnow().isoformat()} monitoring {SITE_URL} and {API_URL}",
+            confidence=1.0
+        )
+
+async def stop_monitoring():
+    await monitor_scheduler.stop()
+    await probe_engine.stop()
+
+async def follower_resync():
+    """Rebuild in-memory pattern windows from incidents the leader recorded"""
+    patterns = tech_director.patterns
+    # Replay on a worker thread and swap the result in on the loop
+    patterns.windows, patterns.severity = await asyncio.get_running_loop().run_in_executor(None, patterns.replay)
+
+leader_elector = LeaderElector(on_elected=start_monitoring, on_demoted=stop_monitoring, on_follow=follower_resync)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background work on the server loop; stop it and flush storage on shutdown"""
+    get_http_client()
+    prompt_cache.load()
+    probe_engine.load()
+    # Every worker serves requests; only the lease holder runs probes and monitoring
+    await leader_elector.tick()
+    leader_elector.start()
+    # Followers still probe when revalidating a stale snapshot, so every worker flushes samples
+    latency_recorder.start()
+    event_bus.start()
+    auth_guard.start()
+    try:
+        yield
+    finally:
+        await auth_guard.stop()
+        await event_bus.stop()
+        await leader_elector.stop()
+        await latency_recorder.stop()
+        if http_client is not None:
+            await http_client.aclose()
+        llm_client.close()
+        storage.close()
 
 # FastAPI app
 app = FastAPI(
@@ -368,7 +3192,8 @@ app = FastAPI(
     description="Your personal AI senior developer monitoring NexteraEstate platform",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Add CORS middleware for local development
@@ -381,6 +3206,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    with tracer.span("http.request", method=request.method, path=request.url.path):
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Label by route template, not raw path, to keep series cardinality bounded
+            route = request.scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            tracer.annotate(route=path, status_code=status)
+            HTTP_REQUESTS.inc(method=request.method, route=path, status=str(status))
+            HTTP_DURATION.observe(time.perf_counter() - started, method=request.method, route=path)
+
 class ChatMessage(BaseModel):
     message: str
     context: Optional[str] = None
@@ -411,36 +3253,77 @@ async def root():
 @app.get("/agent/status")
 async def get_status(request: Request, _=Depends(require_admin)):
     """Get comprehensive platform status"""
-    health_results = await comprehensive_health_check()
+    health_results, health_age, health_stale = await health_snapshot.get()
     
     # Get recent incidents
-    cur.execute("SELECT COUNT(*) FROM incidents WHERE ts > datetime('now', '-1 hour')")
-    recent_incidents = cur.fetchone()[0]
+    recent_incidents = storage.query("SELECT COUNT(*) FROM incidents WHERE last_seen > ?", (now_ts() - 3600,))[0][0]
     
     # Get lessons learned
-    cur.execute("SELECT COUNT(*) FROM lessons")
-    total_lessons = cur.fetchone()[0]
+    total_lessons = storage.query("SELECT COUNT(*) FROM lessons")[0][0]
     
     # Get uptime
     uptime = datetime.utcnow() - tech_director.startup_time
     
     return {
         "health": health_results,
+        "health_age_seconds": health_age,
+        "health_stale": health_stale,
         "incidents_last_hour": recent_incidents,
         "total_lessons_learned": total_lessons,
         "learning_mode": tech_director.learning_enabled,
         "auto_fix_mode": tech_director.auto_fix_enabled,
         "agent_version": "2.0.0",
         "uptime_hours": round(uptime.total_seconds() / 3600, 2),
-        "monitoring_targets": [SITE_URL, API_URL]
+        "monitoring_targets": [SITE_URL, API_URL],
+        "storage": storage.stats(),
+        "monitor": monitor_scheduler.stats(),
+        "leader": leader_elector.stats(),
+        "events": event_bus.stats(),
+        "auth": auth_guard.stats(),
+        "circuits": {"llm": llm_breaker.stats(), "probes": probe_engine.summary()["open_circuits"]},
+        "tracing": {**tracer.stats(), "profiling": profiler.running},
+        "llm_cache": prompt_cache.stats()
     }
 
+@app.post("/agent/events/ticket")
+async def create_event_ticket(request: Request, _=Depends(require_admin)):
+    """Ticket for opening the event stream from a browser (EventSource cannot send headers)"""
+    return issue_event_ticket()
+
+@app.get("/agent/events")
+async def stream_events(request: Request, _=Depends(require_event_stream)):
+    """Server-sent events: health changes, incident transitions, resolutions and new lessons"""
+    if len(event_bus.subscribers) >= EVENT_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many event subscribers")
+    subscriber = event_bus.subscribe()
+    
+    async def stream():
+        try:
+            # Current state first so a (re)connecting dashboard needs no extra fetch
+            hello = {"leader": leader_elector.is_leader}
+            if health_snapshot.results is not None:
+                hello["health"] = health_digest(health_snapshot.results)
+            yield format_sse({"id": event_bus.sequence, "event": "hello", "data": hello})
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.get(), timeout=EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(message)
+        finally:
+            event_bus.unsubscribe(subscriber)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/agent/check")
 async def run_comprehensive_check(request: Request, background_tasks: BackgroundTasks, _=Depends(require_admin)):
     """Run comprehensive health check and intelligent response"""
     logger.info("🔍 Running comprehensive platform check...")
-    health_results = await comprehensive_health_check()
-    response_results = await intelligent_incident_response(health_results)
+    health_results, response_results = await run_check_cycle()
     
     recommendation = await tech_director.llm_analyze(
         f"NexteraEstate platform status: {health_results['overall_status']}. Recent analysis: {json.dumps(response_results)}"
@@ -453,40 +3336,124 @@ async def run_comprehensive_check(request: Request, background_tasks: Background
         "check_time": datetime.utcnow().isoformat()
     }
 
-@app.get("/agent/incidents")
-async def get_incidents(request: Request, limit: int = 50, _=Depends(require_admin)):
-    """Get recent incidents with analysis"""
-    cur.execute("SELECT id, ts, source, kind, severity, message, data, resolved, resolution FROM incidents ORDER BY id DESC LIMIT ?", (limit,))
+INCIDENT_COLUMNS = ["id", "ts", "source", "kind", "severity", "message", "resolved", "resolution", "occurrences", "last_seen"]
+INCIDENT_PAGE_MAX = 500
+
+def decode_incident_data(raw: Any) -> Any:
+    raw = column_codec.decode(raw)
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return {"raw": raw}
+
+def query_incidents(filters: Dict[str, Any], before_id: Optional[int], limit: int, include_data: bool) -> List[Dict[str, Any]]:
+    """One keyset page of incidents, newest first; `data` is only read and decoded when asked for"""
+    clauses, params = [], []
+    for column in ["source", "kind", "severity"]:
+        if filters.get(column) is not None:
+            clauses.append(f"{column} = ?")
+            params.append(filters[column])
+    if filters.get("resolved") is not None:
+        clauses.append("resolved = ?")
+        params.append(bool(filters["resolved"]))
+    if filters.get("since") is not None:
+        clauses.append("last_seen >= ?")
+        params.append(filters["since"])
+    if filters.get("until") is not None:
+        clauses.append("ts <= ?")
+        params.append(filters["until"])
+    if before_id is not None:
+        clauses.append("id < ?")
+        params.append(before_id)
+    
+    columns = INCIDENT_COLUMNS + (["data"] if include_data else [])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = storage.query(f"SELECT {', '.join(columns)} FROM incidents {where} ORDER BY id DESC LIMIT ?", tuple(params) + (limit,))
+    
     incidents = []
-    for row in cur.fetchall():
-        incidents.append({
-            "id": row[0], "timestamp": row[1], "source": row[2], "kind": row[3],
-            "severity": row[4], "message": row[5], "data": json.loads(row[6]) if row[6] else {},
-            "resolved": bool(row[7]), "resolution": row[8]
-        })
+    for row in rows:
+        incident = {
+            "id": row[0], "timestamp": ts_to_iso(row[1]), "source": row[2], "kind": row[3],
+            "severity": row[4], "message": row[5], "resolved": bool(row[6]), "resolution": row[7],
+            "occurrences": row[8] or 1, "last_seen": ts_to_iso(row[9] or row[1])
+        }
+        if include_data:
+            incident["data"] = decode_incident_data(row[10])
+        incidents.append(incident)
+    return incidents
+
+@app.get("/agent/incidents")
+async def get_incidents(
+    request: Request,
+    limit: Optional[int] = None,
+    before_id: Optional[int] = None,
+    source: Optional[str] = None,
+    kind: Optional[str] = None,
+    severity: Optional[str] = None,
+    resolved: Optional[bool] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    include_data: bool = False,
+    analyze: bool = False,
+    format: str = "json",
+    _=Depends(require_admin)
+):
+    """Get incidents newest first.
+
+    Page with `before_id` (pass back `next_cursor`), filter by source/kind/severity/resolved and a
+    since/until range (ISO or epoch seconds). `format=ndjson` streams every match for exports.
+    `data` blobs and LLM analysis are opt-in via `include_data` and `analyze`.
+    """
+    filters = {"source": source, "kind": kind, "severity": severity, "resolved": resolved}
+    for name, value in [("since", since), ("until", until)]:
+        filters[name] = to_epoch(int(value) if value and value.isdigit() else value)
+        if value and filters[name] is None:
+            raise HTTPException(status_code=400, detail=f"{name} must be an ISO timestamp or epoch seconds")
     
-    patterns = tech_director.analyze_pattern(incidents)
+    if format == "ndjson":
+        async def export():
+            cursor, remaining = before_id, limit
+            while remaining is None or remaining > 0:
+                page_size = INCIDENT_PAGE_MAX if remaining is None else min(remaining, INCIDENT_PAGE_MAX)
+                page = query_incidents(filters, cursor, page_size, include_data)
+                for incident in page:
+                    yield json.dumps(incident) + "\n"
+                if len(page) < page_size:
+                    break
+                cursor = page[-1]["id"]
+                if remaining is not None:
+                    remaining -= len(page)
+                await asyncio.sleep(0)
+        return StreamingResponse(export(), media_type="application/x-ndjson")
     
-    analysis = "No significant patterns detected." if not patterns else await tech_director.llm_analyze(
-        f"NexteraEstate incident patterns: {json.dumps(patterns)}"
-    )
+    page_size = max(1, min(limit or 50, INCIDENT_PAGE_MAX))
+    incidents = query_incidents(filters, before_id, page_size, include_data)
+    patterns = tech_director.analyze_pattern()
+    
+    analysis = None
+    if analyze:
+        analysis = "No significant patterns detected." if not patterns else await tech_director.llm_analyze(
+            f"NexteraEstate incident patterns: {json.dumps(patterns)}"
+        )
     
     return {
         "incidents": incidents,
         "patterns": patterns,
         "analysis": analysis,
-        "total_count": len(incidents)
+        "total_count": len(incidents),
+        "next_cursor": incidents[-1]["id"] if len(incidents) == page_size else None
     }
 
 @app.get("/agent/lessons")
 async def get_lessons(request: Request, _=Depends(require_admin)):
     """Get lessons learned"""
-    cur.execute("SELECT id, ts, category, lesson, confidence, applied_count FROM lessons ORDER BY confidence DESC, id DESC LIMIT 100")
     lessons = []
-    for row in cur.fetchall():
+    for row in storage.query("SELECT id, ts, category, lesson, confidence, applied_count FROM lessons ORDER BY confidence DESC, id DESC LIMIT 100"):
         lessons.append({
-            "id": row[0], "timestamp": row[1], "category": row[2],
-            "lesson": row[3], "confidence": row[4], "applied_count": row[5]
+            "id": row[0], "timestamp": ts_to_iso(row[1]), "category": row[2],
+            "lesson": column_codec.decode(row[3]), "confidence": row[4], "applied_count": row[5]
         })
     
     return {"lessons": lessons, "total": len(lessons)}
@@ -494,106 +3461,256 @@ async def get_lessons(request: Request, _=Depends(require_admin)):
 @app.post("/agent/teach")
 async def teach_agent(input: TeachingInput, request: Request, _=Depends(require_admin)):
     """Teach the agent new knowledge"""
-    tech_director.add_lesson(input.category, input.lesson, input.confidence)
-    return {"success": True, "message": "Lesson learned and stored", "category": input.category}
+    # Owner teaching is kept verbatim, never folded into a similar lesson
+    lesson_id = await tech_director.add_lesson(input.category, input.lesson, input.confidence, merge=False)
+    return {"success": True, "message": "Lesson learned and stored", "category": input.category, "lesson_id": lesson_id}
 
-@app.post("/agent/chat")
-async def chat_with_agent(input: ChatMessage, request: Request, _=Depends(require_admin)):
-    """Chat with your tech director"""
+def fts_query(text: str, max_terms: int = 16) -> str:
+    """OR of the distinct meaningful words in free text, quoted so FTS5 syntax in input is inert"""
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        if len(word) > 2 and word not in SEARCH_STOPWORDS and word not in terms:
+            terms.append(word)
+    return " OR ".join(f'"{term}"' for term in terms[:max_terms])
+
+def search_knowledge(text: str, limit: int = SEARCH_CANDIDATES) -> List[Dict[str, Any]]:
+    """BM25-ranked snippets from lessons, knowledge, incidents and fixes"""
+    query = fts_query(text)
+    if not query:
+        return []
+    rows = storage.query(
+        "SELECT rowid, snippet(search_index, 0, '', '', '…', ?), bm25(search_index) FROM search_index "
+        "WHERE search_index MATCH ? ORDER BY rank LIMIT ?",
+        (SEARCH_SNIPPET_TOKENS, query, limit)
+    )
+    return [
+        {"kind": SEARCH_KINDS[rowid % 4], "id": rowid // 4, "snippet": snippet, "score": round(-score, 3)}
+        for rowid, snippet, score in rows
+    ]
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def within_budget(snippets: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """Greedily keep snippets in rank order while they fit the token budget"""
+    chosen, used = [], 0
+    for snippet in snippets:
+        cost = estimate_tokens(snippet["snippet"])
+        if used + cost <= budget:
+            chosen.append(snippet)
+            used += cost
+    return chosen
+
+CHAT_CONTEXT_SECTIONS = [
+    ("incident", "Related NexteraEstate issues"),
+    ("lesson", "Relevant lessons learned"),
+    ("knowledge", "Knowledge base"),
+    ("fix", "Past fixes"),
+]
+
+def build_chat_context(input: ChatMessage, budget: int = CHAT_CONTEXT_TOKENS) -> str:
+    """Chat prompt with the incidents, lessons, knowledge and fixes most relevant to the question"""
     context = input.context or "You are speaking with the owner of NexteraEstate platform."
     
-    # Get recent context
-    cur.execute("SELECT message FROM incidents ORDER BY id DESC LIMIT 5")
-    recent_issues = [row[0] for row in cur.fetchall()]
+    snippets = search_knowledge(input.message)
+    if not snippets:
+        # Nothing matched: fall back to what is recent and most trusted
+        clip = SEARCH_SNIPPET_TOKENS * 6
+        snippets = [{"kind": "incident", "snippet": row[0][:clip]} for row in storage.query(
+            "SELECT message FROM incidents WHERE message IS NOT NULL ORDER BY id DESC LIMIT 5")]
+        snippets += [{"kind": "lesson", "snippet": column_codec.decode(row[0])[:clip]} for row in storage.query(
+            "SELECT lesson FROM lessons WHERE lesson IS NOT NULL ORDER BY confidence DESC LIMIT 10")]
+    chosen = within_budget(snippets, budget)
     
-    cur.execute("SELECT lesson FROM lessons ORDER BY confidence DESC LIMIT 10")
-    top_lessons = [row[0] for row in cur.fetchall()]
+    sections = []
+    for kind, title in CHAT_CONTEXT_SECTIONS:
+        found = [snippet["snippet"] for snippet in chosen if snippet["kind"] == kind]
+        if found:
+            sections.append(f"{title}: {'; '.join(found)}")
+    history = "\n    ".join(sections) or "No related history yet."
     
-    full_context = f"""
+    return f"""
     {context}
     
-    Recent NexteraEstate issues: {'; '.join(recent_issues) if recent_issues else 'None'}
-    Key lessons learned: {'; '.join(top_lessons) if top_lessons else 'None yet'}
+    {history}
     
     Question: {input.message}
     """
-    
-    response = await tech_director.llm_analyze(full_context)
+
+def chat_mood(response: str) -> str:
+    return "Ready to help" if "healthy" in response.lower() else "Focused on resolving issues"
+
+@app.post("/agent/chat")
+async def chat_with_agent(input: ChatMessage, request: Request, _=Depends(require_admin)):
+    """Chat with your tech director"""
+    response = await tech_director.llm_analyze(build_chat_context(input))
     
     return {
         "response": response,
         "context_used": True,
-        "agent_mood": "Ready to help" if "healthy" in response.lower() else "Focused on resolving issues",
+        "agent_mood": chat_mood(response),
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.post("/agent/chat/stream")
+async def chat_with_agent_stream(input: ChatMessage, request: Request, _=Depends(require_admin)):
+    """Chat with your tech director, relaying the answer as server-sent "token" events"""
+    # Assembled before the response starts so the first byte waits only on the model
+    full_context = build_chat_context(input)
+    
+    async def stream():
+        parts = []
+        sequence = 0
+        async for text in tech_director.llm_stream(full_context):
+            parts.append(text)
+            sequence += 1
+            yield format_sse({"id": sequence, "event": "token", "data": {"text": text}})
+        response = "".join(parts)
+        yield format_sse({"id": sequence + 1, "event": "done", "data": {
+            "context_used": True,
+            "agent_mood": chat_mood(response),
+            "chars": len(response),
+            "timestamp": datetime.utcnow().isoformat()
+        }})
+    
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/agent/search")
+async def search(q: str, request: Request, limit: int = 20, _=Depends(require_admin)):
+    """Full-text search across lessons, knowledge, incidents and fixes"""
+    return {"query": q, "results": search_knowledge(q, limit=max(1, min(limit, 100)))}
+
+@app.get("/agent/probes")
+async def get_probes(request: Request, _=Depends(require_admin)):
+    """List registered probe targets with their latest results"""
+    return {
+        "targets": [
+            {
+                **target.model_dump(),
+                "last_result": probe_engine.results.get(name),
+                "circuit": probe_engine.breaker(name).stats(),
+                "next_probe_in_seconds": round(max(0.0, probe_engine.next_due[name] - time.monotonic()), 1)
+                if name in probe_engine.next_due else None,
+            }
+            for name, target in probe_engine.targets.items()
+        ],
+        "summary": probe_engine.summary()
+    }
+
+@app.post("/agent/probes/reload")
+async def reload_probes(request: Request, _=Depends(require_admin)):
+    """Re-read the probe registry from the probe_targets table and PROBES_FILE"""
+    probe_engine.load()
+    return {"success": True, "targets": len(probe_engine.targets)}
+
+@app.get("/agent/latency")
+async def get_latency(
+    request: Request,
+    target: str = "api_health",
+    metric: str = "total_ms",
+    tier: str = "1m",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    _=Depends(require_admin)
+):
+    """Probe latency series: raw samples or 1m/1h/1d rollups (count/avg/min/max per bucket)"""
+    if tier != "raw" and tier not in METRIC_TIERS:
+        raise HTTPException(status_code=400, detail=f"tier must be one of raw, {', '.join(METRIC_TIERS)}")
+    bounds = {}
+    for name, value in [("since", since), ("until", until)]:
+        bounds[name] = to_epoch(int(value) if value and value.isdigit() else value)
+        if value and bounds[name] is None:
+            raise HTTPException(status_code=400, detail=f"{name} must be an ISO timestamp or epoch seconds")
+    until_ts = bounds["until"] or now_ts()
+    since_ts = bounds["since"] or until_ts - 60 * METRIC_TIERS.get(tier, 60)
+    
+    await latency_recorder.flush()
+    return {
+        "target": target,
+        "metric": metric,
+        "tier": tier,
+        "points": latency_recorder.series(target, metric, tier, since_ts, until_ts)
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics(request: Request, format: str = "prometheus", _=Depends(require_admin)):
+    """Prometheus text exposition; `format=json` adds estimated p50/p95/p99 per histogram"""
+    if format == "json":
+        return metrics.summary()
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+TRACE_FORMATS = {"chrome": tracer.chrome, "otlp": tracer.otlp}
+
+@app.get("/agent/traces")
+async def get_traces(request: Request, limit: int = 50, _=Depends(require_admin)):
+    """Recent traces from the span ring buffer, newest first"""
+    return {"traces": tracer.traces(max(1, min(limit, 500))), "tracer": tracer.stats()}
+
+@app.get("/agent/traces/export")
+async def export_traces(
+    request: Request,
+    format: str = "chrome",
+    trace_id: Optional[str] = None,
+    limit: Optional[int] = None,
+    save: bool = False,
+    _=Depends(require_admin)
+):
+    """Buffered spans as Chrome trace-event or OTLP/JSON; `save=true` writes them under TRACE_EXPORT_DIR"""
+    if format not in TRACE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(TRACE_FORMATS)}")
+    spans = tracer.select(trace_id, limit)
+    if trace_id and not spans:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have rotated out of the buffer)")
+    document = TRACE_FORMATS[format](spans)
+    if not save:
+        return document
+    
+    os.makedirs(TRACE_EXPORT_DIR, exist_ok=True)
+    path = os.path.join(TRACE_EXPORT_DIR, f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{trace_id or 'all'}_{format}.json")
+    with open(path, "w") as f:
+        json.dump(document, f)
+    return {"path": os.path.abspath(path), "format": format, "spans": len(spans)}
+
+@app.post("/agent/profile")
+async def capture_profile(
+    request: Request,
+    seconds: float = 10,
+    interval_ms: float = PROFILE_INTERVAL_MS,
+    format: str = "json",
+    _=Depends(require_admin)
+):
+    """Sampling CPU profile of the running process; `format=folded` returns flamegraph input"""
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}")
+    if format not in ("json", "folded"):
+        raise HTTPException(status_code=400, detail="format must be json or folded")
+    logger.info(f"🔬 Capturing {seconds:g}s CPU profile at {interval_ms:g}ms intervals")
+    profile = await profiler.capture(seconds, max(1.0, interval_ms) / 1000)
+    if profile is None:
+        raise HTTPException(status_code=409, detail="A profile capture is already running")
+    if format == "folded":
+        return PlainTextResponse("\n".join(profile["folded"]) + "\n")
+    return profile
+
 @app.post("/agent/resolve-incident/{incident_id}")
 async def resolve_incident(incident_id: int, request: Request, _=Depends(require_admin)):
     """Mark incident as resolved"""
     body = await request.json()
     resolution = body.get("resolution", "Manually resolved by owner")
     
-    cur.execute("UPDATE incidents SET resolved = TRUE, resolution = ? WHERE id = ?", (resolution, incident_id))
-    conn.commit()
+    if not await tech_director.resolve_incident(incident_id, resolution):
+        raise HTTPException(status_code=404, detail=f"Incident {incident_id} not found")
     
     logger.info(f"✅ Incident {incident_id} marked as resolved: {resolution}")
     
     return {"success": True, "message": f"Incident {incident_id} marked as resolved"}
 
-# Background scheduler for autonomous monitoring  
-scheduler = BackgroundScheduler()
-
-def autonomous_monitoring_job():
-    """Autonomous monitoring job that runs every 5 minutes"""
-    try:
-        logger.info("🤖 Running autonomous monitoring check...")
-        # Run the monitoring in an async context
-        async def monitor():
-            health_results = await comprehensive_health_check()
-            response_results = await intelligent_incident_response(health_results)
-            
-            # Log summary
-            status = health_results["overall_status"]
-            incidents = response_results["incidents_created"]
-            if incidents > 0:
-                logger.warning(f"⚠️ Monitoring detected {incidents} new incidents - platform status: {status}")
-            else:
-                logger.info(f"✅ Monitoring complete - platform status: {status}")
-        
-        # Use asyncio to run the async function
-        import asyncio
-        try:
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(monitor())
-        except RuntimeError:
-            # If no loop exists, create a new one
-            asyncio.run(monitor())
-            
-    except Exception as e:
-        logger.error(f"❌ Autonomous monitoring failed: {e}")
-
-# Schedule monitoring every 5 minutes
-scheduler.add_job(
-    autonomous_monitoring_job,
-    "interval",
-    minutes=5,
-    next_run_time=datetime.utcnow() + timedelta(seconds=60)  # First check in 1 minute
-)
-
-try:
-    scheduler.start()
-    logger.info("⏰ Autonomous monitoring scheduler started - checks every 5 minutes")
-except Exception as e:
-    logger.error(f"❌ Failed to start scheduler: {e}")
-
-# Add startup lesson
-tech_director.add_lesson(
-    "startup", 
-    f"Tech Director deployed at {datetime.utcnow().isoformat()} monitoring {SITE_URL} and {API_URL}",
-    confidence=1.0
-)
-
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting NexteraEstate Autonomous Tech Director on port 8787...")
-    uvicorn.run(app, host="0.0.0.0", port=8787)
\ No newline at end of file
+    if AGENT_WORKERS > 1:
+        # Workers re-import the module, so uvicorn needs the import string
+        uvicorn.run("app:app", host="0.0.0.0", port=8787, workers=AGENT_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8787)
\ No newline at end of file
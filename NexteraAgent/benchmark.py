@@ -0,0 +1,377 @@
+"""Repeatable load benchmark for the Tech Director agent.
+
+Starts local stand-ins for SITE_URL and API_URL (configurable latency, error rate and
+outage windows), swaps Gemini for a fake model with fixed latency, runs the agent under
+uvicorn in a private working directory, then drives its endpoints and the monitoring
+cycle at fixed concurrency. Results are printed and saved as JSON for comparison:
+
+    python benchmark.py
+    python benchmark.py --scenarios status,chat --concurrency 50 --llm-latency-ms 800
+    python benchmark.py --compare benchmark_results/<previous>.json
+"""
+import os, sys, json, time, math, asyncio, random, argparse, itertools, platform, subprocess, tempfile, threading, types
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+import uvicorn
+from fastapi import FastAPI, Response
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class StubBehaviour:
+    """Latency, error rate and outage windows (seconds after start) of one stub server"""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float, outages: List[Tuple[float, float]]):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.outages = outages
+        self.started = time.monotonic()
+        self.requests = 0
+
+    async def respond(self, body: Dict[str, Any]) -> Response:
+        self.requests += 1
+        await asyncio.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+        elapsed = time.monotonic() - self.started
+        if any(start <= elapsed < end for start, end in self.outages):
+            return Response(status_code=503, content="outage")
+        if random.random() < self.error_rate:
+            return Response(status_code=500, content="injected error")
+        return Response(content=json.dumps(body), media_type="application/json")
+
+def stub_app(behaviour: StubBehaviour) -> FastAPI:
+    """Serves the paths the core probes hit on both the site and the API"""
+    stub = FastAPI()
+
+    @stub.get("/")
+    async def home():
+        return await behaviour.respond({"page": "home"})
+
+    @stub.get("/api/auth/session")
+    async def session():
+        return await behaviour.respond({})
+
+    @stub.get("/api/health")
+    async def health():
+        return await behaviour.respond({"status": "ok", "features": {"wills": True, "payments": True}})
+
+    return stub
+
+class FakeGemini:
+    """Stands in for genai.GenerativeModel: fixed latency, counted calls, optional streaming"""
+
+    def __init__(self, latency_ms: float, chunks: int = 8):
+        self.latency = latency_ms / 1000
+        self.chunks = chunks
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt: str, stream: bool = False, request_options: Optional[dict] = None):
+        with self.lock:
+            self.calls += 1
+        text = f"Benchmark analysis ({len(prompt)} prompt chars): platform looks healthy, keep monitoring."
+        if not stream:
+            time.sleep(self.latency)
+            return types.SimpleNamespace(text=text)
+        def chunks():
+            for i in range(self.chunks):
+                time.sleep(self.latency / self.chunks)
+                yield types.SimpleNamespace(text=text[i * len(text) // self.chunks:(i + 1) * len(text) // self.chunks])
+        return chunks()
+
+def start_server(app: FastAPI, port: int) -> Tuple[uvicorn.Server, asyncio.AbstractEventLoop]:
+    """Run an ASGI app on its own thread and loop; returns once it accepts connections"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    ready = threading.Event()
+    holder = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        holder["loop"] = loop
+        ready.set()
+        loop.run_until_complete(server.serve())
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server on port {port} did not start")
+        time.sleep(0.05)
+    return server, holder["loop"]
+
+def parse_outages(spec: str) -> List[Tuple[float, float]]:
+    """"5:15,40:45" -> [(5, 15), (40, 45)]"""
+    outages = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        start, end = part.split(":")
+        outages.append((float(start), float(end)))
+    return outages
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=AGENT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace, agent, fake_llm: FakeGemini, agent_loop: asyncio.AbstractEventLoop):
+        self.args = args
+        self.agent = agent
+        self.fake_llm = fake_llm
+        self.agent_loop = agent_loop
+        self.base_url = f"http://127.0.0.1:{args.port}"
+        self.headers = {"Authorization": f"Bearer {agent.ADMIN_TOKEN}"}
+
+    async def settle_writes(self) -> int:
+        """Wait until every queued write is committed; returns rows written so far"""
+        await asyncio.wrap_future(self.agent.storage.submit("DELETE FROM events WHERE 0"))
+        return self.agent.storage.rows_written
+
+    def snapshot(self) -> Dict[str, float]:
+        cache = self.agent.prompt_cache.stats()
+        return {"llm_calls": self.fake_llm.calls, "cache_hits": cache["hits"], "commits": self.agent.storage.commits}
+
+    def summarise(self, name: str, latencies: List[float], statuses: Dict[str, int], elapsed: float,
+                  rows: int, before: Dict[str, float], concurrency: int) -> Dict[str, Any]:
+        after = self.snapshot()
+        ordered = sorted(latencies)
+        errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+        return {
+            "requests": len(latencies),
+            "concurrency": concurrency,
+            "errors": errors,
+            "statuses": statuses,
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(ordered, 50) * 1000, 2),
+                "p90": round(percentile(ordered, 90) * 1000, 2),
+                "p99": round(percentile(ordered, 99) * 1000, 2),
+                "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+                "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+            },
+            "db_rows_written": rows,
+            "db_rows_per_sec": round(rows / elapsed, 1) if elapsed else 0.0,
+            "db_commits": after["commits"] - before["commits"],
+            "llm_calls": after["llm_calls"] - before["llm_calls"],
+            "llm_cache_hits": after["cache_hits"] - before["cache_hits"],
+        }
+
+    async def run_http(self, name: str, make_request, total: int, concurrency: int) -> Dict[str, Any]:
+        latencies: List[float] = []
+        statuses: Dict[str, int] = {}
+        counter = itertools.count()
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, limits=limits, timeout=120) as client:
+            async def worker():
+                while True:
+                    i = next(counter)
+                    if i >= total:
+                        return
+                    method, path, body = make_request(i)
+                    started = time.perf_counter()
+                    try:
+                        response = await client.request(method, path, json=body)
+                        status = str(response.status_code)
+                    except httpx.HTTPError as e:
+                        status = type(e).__name__
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            rows_before = await self.settle_writes()
+            before = self.snapshot()
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            rows = await self.settle_writes() - rows_before - 1
+        return self.summarise(name, latencies, statuses, elapsed, rows, before, concurrency)
+
+    async def run_monitor(self, cycles: int) -> Dict[str, Any]:
+        """Back-to-back autonomous monitoring cycles on the agent's own loop"""
+        latencies: List[float] = []
+        statuses: Dict[str, int] = {}
+        rows_before = await self.settle_writes()
+        before = self.snapshot()
+        started = time.perf_counter()
+        for _ in range(cycles):
+            cycle_started = time.perf_counter()
+            future = asyncio.run_coroutine_threadsafe(self.agent.autonomous_monitoring_job(), self.agent_loop)
+            try:
+                await asyncio.wrap_future(future)
+                status = "200"
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - cycle_started)
+            statuses[status] = statuses.get(status, 0) + 1
+        elapsed = time.perf_counter() - started
+        rows = await self.settle_writes() - rows_before - 1
+        return self.summarise("monitor", latencies, statuses, elapsed, rows, before, 1)
+
+    def scenarios(self) -> Dict[str, Tuple[Any, int, int]]:
+        """name -> (request factory, requests, concurrency)"""
+        args = self.args
+        questions = ["Why is the API slow?", "Any payment webhook failures?", "Is the site healthy?",
+                     "What did we learn about deploys?", "Summarise open incidents"]
+
+        def chat(i):
+            # Unique suffixes defeat the prompt cache unless --chat-repeat asks for hits
+            suffix = "" if random.random() < args.chat_repeat else f" (#{i})"
+            return "POST", "/agent/chat", {"message": random.choice(questions) + suffix}
+
+        return {
+            "status": (lambda i: ("GET", "/agent/status", None), args.requests or 500, args.concurrency or 20),
+            "incidents": (lambda i: ("GET", "/agent/incidents?limit=50", None), args.requests or 300, args.concurrency or 10),
+            "check": (lambda i: ("POST", "/agent/check", None), args.requests or 40, args.concurrency or 5),
+            "chat": (chat, args.requests or 60, args.concurrency or 6),
+        }
+
+    async def run(self) -> Dict[str, Any]:
+        results = {}
+        defined = self.scenarios()
+        for name in self.args.scenarios.split(","):
+            name = name.strip()
+            print(f"⏱️  {name} ...", flush=True)
+            if name == "monitor":
+                results[name] = await self.run_monitor(self.args.cycles)
+            elif name in defined:
+                make_request, total, concurrency = defined[name]
+                results[name] = await self.run_http(name, make_request, total, concurrency)
+            else:
+                print(f"⚠️  Unknown scenario: {name}")
+        return results
+
+def seed_incidents(agent, count: int):
+    """History for /agent/incidents to page over.
+
+    Only auth incidents stay open: open site/api rows would all be auto-resolved (each with
+    a "learn" LLM call) by the first healthy check and skew that scenario.
+    """
+    if count <= 0:
+        return
+    now = agent.now_ts()
+    kinds = [("site", "down", "critical"), ("api", "degraded", "high"), ("probe", "timeout", "medium"), ("auth", "unauthorized", "high")]
+    rows = []
+    for i in range(count):
+        source, kind, severity = random.choice(kinds)
+        ts = now - random.randint(0, 7 * 86400)
+        rows.append((ts, source, kind, severity, f"Seeded {source}.{kind} #{i}", json.dumps({"seed": i}),
+                     source != "auth", agent.incident_fingerprint(source, kind, str(i)), 1, ts))
+    agent.storage.submit_many(
+        "INSERT INTO incidents(ts,source,kind,severity,message,data,resolved,fingerprint,occurrences,last_seen) VALUES (?,?,?,?,?,?,?,?,?,?)",
+        rows
+    ).result()
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    header = f"{'scenario':<10} {'reqs':>6} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'rows/s':>9} {'llm':>5}"
+    print("\n" + header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<10} {r['requests']:>6} {r['errors']:>5} {r['throughput_rps']:>9} {r['latency_ms']['p50']:>9} "
+              f"{r['latency_ms']['p90']:>9} {r['latency_ms']['p99']:>9} {r['db_rows_per_sec']:>9} {r['llm_calls']:>5}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            def change(new, old):
+                return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{'  vs base':<10} {'':>6} {'':>5} {change(r['throughput_rps'], previous['throughput_rps']):>9} "
+                  f"{change(r['latency_ms']['p50'], previous['latency_ms']['p50']):>9} "
+                  f"{change(r['latency_ms']['p90'], previous['latency_ms']['p90']):>9} "
+                  f"{change(r['latency_ms']['p99'], previous['latency_ms']['p99']):>9}")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the NexteraEstate Tech Director agent against local stubs")
+    parser.add_argument("--scenarios", default="status,incidents,check,chat,monitor",
+                        help="comma-separated: status, incidents, check, chat, monitor")
+    parser.add_argument("--requests", type=int, default=0, help="requests per HTTP scenario (0 = scenario default)")
+    parser.add_argument("--concurrency", type=int, default=0, help="concurrent clients per HTTP scenario (0 = scenario default)")
+    parser.add_argument("--cycles", type=int, default=10, help="monitoring cycles in the monitor scenario")
+    parser.add_argument("--port", type=int, default=18787, help="agent port")
+    parser.add_argument("--site-port", type=int, default=18788)
+    parser.add_argument("--api-port", type=int, default=18789)
+    parser.add_argument("--site-latency-ms", type=float, default=40)
+    parser.add_argument("--api-latency-ms", type=float, default=25)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--site-error-rate", type=float, default=0.0)
+    parser.add_argument("--api-error-rate", type=float, default=0.0)
+    parser.add_argument("--site-outage", default="", help='outage windows in seconds after start, e.g. "5:15,40:45"')
+    parser.add_argument("--api-outage", default="")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--chat-repeat", type=float, default=0.0, help="fraction of chat questions repeated verbatim (cache hits)")
+    parser.add_argument("--seed-incidents", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1, help="random seed for stub errors and request mix")
+    parser.add_argument("--workdir", default="", help="directory for the agent database (default: fresh temp dir)")
+    parser.add_argument("--output", default=os.path.join(AGENT_DIR, "benchmark_results"), help="directory for result JSON")
+    parser.add_argument("--compare", default="", help="previous result JSON to diff against")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    random.seed(args.seed)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="nextera-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+
+    site = StubBehaviour(args.site_latency_ms, args.jitter_ms, args.site_error_rate, parse_outages(args.site_outage))
+    api = StubBehaviour(args.api_latency_ms, args.jitter_ms, args.api_error_rate, parse_outages(args.api_outage))
+    start_server(stub_app(site), args.site_port)
+    start_server(stub_app(api), args.api_port)
+
+    # The agent reads its configuration at import time and keeps its database in the cwd
+    os.environ.update({
+        "SITE_URL": f"http://127.0.0.1:{args.site_port}",
+        "API_URL": f"http://127.0.0.1:{args.api_port}",
+        "GEMINI_API_KEY": "benchmark-fake-key",
+        "MONITOR_INITIAL_DELAY": "86400",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    os.chdir(workdir)
+    sys.path.insert(0, AGENT_DIR)
+    import app as agent
+
+    fake_llm = FakeGemini(args.llm_latency_ms)
+    agent.llm_client.model = fake_llm
+    seed_incidents(agent, args.seed_incidents)
+    server, agent_loop = start_server(agent.app, args.port)
+
+    print(f"🏁 Benchmarking agent at http://127.0.0.1:{args.port} (workdir {workdir})")
+    try:
+        results = asyncio.run(Benchmark(args, agent, fake_llm, agent_loop).run())
+    finally:
+        server.should_exit = True
+        time.sleep(1)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "workdir")},
+            "stub_requests": {"site": site.requests, "api": api.requests},
+        },
+        "scenarios": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f).get("scenarios", {})
+    print_report(results, baseline)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{report['meta']['git_commit']}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to {path}")
+    return report
+
+if __name__ == "__main__":
+    main()